@@ -0,0 +1,250 @@
+'''
+approx_q.py
+
+Approximate q learning with a linear function of board features instead of a
+table. A position is described by a handful of numbers from red's point of
+view, its material, kings, back rank guards, mobility and center control,
+and its value is their dot product with a weight vector. The weights are
+trained in mini-batches from self play, take constant memory, value
+positions that were never seen and work on every board size. A trained
+model is saved as a small JSON file and can be played by player.move in
+place of a q table.
+'''
+
+import json
+from os import makedirs, replace
+from os.path import dirname, isfile
+from random import randint, seed, uniform
+
+import numpy as np
+
+import batch
+import q_learning
+from state import GameHistory, Piece, Player
+
+# names of the columns returned by features
+FEATURES = ('bias', 'pawns', 'kings', 'back_rank', 'mobility', 'center',
+            'to_move')
+FORMAT = 'linear-q'
+VERSION = 1
+
+
+def _neighbours(mask, dx, dy):
+    """Marks the squares whose (x + dx, y + dy) neighbour is set in mask."""
+    n = mask.shape[1]
+    shifted = np.zeros_like(mask)
+    shifted[:, max(0, -dy):n - max(0, dy), max(0, -dx):n - max(0, dx)] = \
+        mask[:, max(0, dy):n - max(0, -dy), max(0, dx):n - max(0, -dx)]
+    return shifted
+
+
+def _mobility(pawns, kings, forward, empty):
+    """Counts the simple moves of one side, pawns only step forward."""
+    count = 0
+    for dx in (1, -1):
+        for dy in (1, -1):
+            movers = kings | pawns if dy == forward else kings
+            count = count + (movers & _neighbours(empty, dx, dy)).sum(
+                axis=(1, 2))
+    return count
+
+
+def features(boards, whose_move, board_size):
+    """Returns the (N, len(FEATURES)) features of encoded positions.
+
+    Every feature but the bias and the side to move is red's count less
+    black's, scaled by the pieces a side starts with so the weights carry
+    over between board sizes.
+    """
+    n = board_size
+    b = boards.reshape(-1, n, n)
+    red_pawns = b == Piece.RED_PAWN
+    red_kings = b == Piece.RED_KING
+    black_pawns = b == Piece.BLACK_PAWN
+    black_kings = b == Piece.BLACK_KING
+    red = red_pawns | red_kings
+    black = black_pawns | black_kings
+    scale = 1 / ((n // 2) * (n // 2 - 1))
+    low, high = n // 4, n - n // 4
+
+    X = np.empty((len(b), len(FEATURES)))
+    X[:, 0] = 1
+    X[:, 1] = (red_pawns.sum(axis=(1, 2)) -
+               black_pawns.sum(axis=(1, 2))) * scale
+    X[:, 2] = (red_kings.sum(axis=(1, 2)) -
+               black_kings.sum(axis=(1, 2))) * scale
+    # pieces still on their own first row keep the other side from crowning
+    X[:, 3] = (red[:, n - 1].sum(axis=1) - black[:, 0].sum(axis=1)) / (n // 2)
+    empty = b == Piece.EMPTY
+    # red moves up the board, towards row 0
+    X[:, 4] = (_mobility(red_pawns, red_kings, -1, empty) -
+               _mobility(black_pawns, black_kings, 1, empty)) * scale / 2
+    X[:, 5] = (red[:, low:high, low:high].sum(axis=(1, 2)) -
+               black[:, low:high, low:high].sum(axis=(1, 2))) * scale
+    X[:, 6] = np.where(whose_move == Player.RED, 1, -1)
+    return X
+
+
+def state_features(states):
+    """features of State objects of one board size."""
+    boards, whose_move = batch.encode(states)
+    return features(boards, whose_move, states[0].board_size)
+
+
+class LinearQ:
+    """Q values as a linear function of the board features.
+
+    Values are from red's point of view, like the entries of a q table.
+    """
+    def __init__(self, weights=None):
+        if weights is None:
+            weights = np.zeros(len(FEATURES))
+        self.weights = np.array(weights, dtype=float)
+
+    def values(self, states):
+        """Returns the values of a list of states as an array."""
+        return state_features(states) @ self.weights
+
+    def value(self, state):
+        """Returns the value of one state."""
+        return float(self.values([state])[0])
+
+    def successor_values(self, state):
+        """Returns the legal moves of state and the values they lead to."""
+        moves, boards, whose_move, _ = batch.encode_successors(state)
+        X = features(boards, whose_move, state.board_size)
+        return moves, (X @ self.weights).tolist()
+
+    def update(self, inputs, targets, learning_rate):
+        """Takes one mini-batch step towards the targets.
+
+        Each row's step is normalized by the size of its features, so
+        learning rates up to 1 are stable. Returns the mean squared error
+        before the step.
+        """
+        errors = targets - inputs @ self.weights
+        norms = (inputs * inputs).sum(axis=1) + 1
+        self.weights += learning_rate * (
+            inputs * (errors / norms)[:, None]).mean(axis=0)
+        return float((errors * errors).mean())
+
+    def save(self, file_location):
+        """Writes the weights as JSON, replacing any older file at once."""
+        if dirname(file_location):
+            makedirs(dirname(file_location), exist_ok=True)
+        with open(file_location + '.tmp', 'w') as file:
+            json.dump({'format': FORMAT, 'version': VERSION,
+                       'features': FEATURES,
+                       'weights': self.weights.tolist()}, file, indent=1)
+        replace(file_location + '.tmp', file_location)
+
+    @classmethod
+    def load(cls, file_location):
+        """Reads weights written by save."""
+        with open(file_location) as file:
+            data = json.load(file)
+        if data.get('format') != FORMAT or \
+                tuple(data['features']) != FEATURES:
+            raise ValueError('%s holds other features' % file_location)
+        return cls(data['weights'])
+
+
+def approx_q_learning(settings, initial_state):
+    """Trains a LinearQ by self play, see q_learning.q_learning.
+
+    Uses the same settings; BATCH_SIZE moves are collected between weight
+    updates. Games are played in this process and training restarts from
+    zero weights unless the finished model is cached.
+    """
+    settings = dict(q_learning.DEFAULT_SETTINGS, **settings)
+    board_size = initial_state.board_size
+    prefix = q_learning.cache_prefix(settings, board_size)
+    cache_path = '%s-%d.weights.json' % (prefix, settings['Q_GAMES'])
+    if isfile(cache_path):
+        return LinearQ.load(cache_path)
+    model = LinearQ()
+    if settings['SEED'] is not None:
+        seed(settings['SEED'])
+    _play_games(model, settings, initial_state, settings['Q_GAMES'])
+    model.save(cache_path)
+    q_learning._write_settings(prefix + '.json', settings, board_size)
+    return model
+
+
+def _successors(model, state):
+    """Returns the moves of state with the features, rewards, winners and
+    values of the positions they lead to."""
+    moves, boards, whose_move, kills = batch.encode_successors(state)
+    counts = batch.piece_counts(boards)
+    winners = batch.winners(counts, whose_move)
+    X = features(boards, whose_move, state.board_size)
+    return (moves, X, batch.rewards(counts, whose_move, kills, winners),
+            winners, X @ model.weights)
+
+
+def _best(values, maximize):
+    """Index of the best value, ties broken at random like _best_action."""
+    best = values.max() if maximize else values.min()
+    ties = np.flatnonzero(values == best)
+    return int(ties[randint(0, len(ties) - 1)])
+
+
+def _play_games(model, settings, initial_state, n_games):
+    """Plays n_games episodes of self play, updating the model weights.
+
+    A position is moved towards the reward of the move played from it plus
+    the discounted best value after that move, the target q_learning._update
+    uses for a table.
+    """
+    EXPLORE_PROB = settings['EXPLORE_PROB']
+    LEARNING_RATE = settings['LEARNING_RATE']
+    DISCOUNT = settings['DISCOUNT']
+    BATCH_SIZE = settings['BATCH_SIZE']
+
+    inputs, targets = [], []
+    start = state_features([initial_state])[0]
+    for _ in range(n_games):
+        state, x = initial_state, start
+        history = GameHistory(initial_state)
+        moves, X, rewards, winners, values = _successors(model, state)
+        episode_length = 0
+        while True:
+            if uniform(0.0, 1.0) < EXPLORE_PROB:
+                i = randint(0, len(moves) - 1)
+            else:
+                i = _best(values, state.whose_move == Player.RED)
+            new_state = state.move(moves[i])
+            drawn = history.push(state, moves[i], new_state)
+            episode_length += 1
+            game_over = winners[i] != 0
+            if not game_over:
+                successors = _successors(model, new_state)
+                # a player that cannot move loses
+                game_over = not successors[0]
+            if game_over and winners[i]:
+                target = rewards[i]
+            elif game_over:
+                target = 100 if new_state.whose_move == Player.BLACK else -100
+            elif drawn:
+                target = q_learning.DRAW_REWARD
+            else:
+                next_values = successors[4]
+                if new_state.whose_move == Player.RED:
+                    q_prime = next_values.max()
+                else:
+                    q_prime = next_values.min()
+                target = rewards[i] + DISCOUNT * q_prime
+            inputs.append(x)
+            targets.append(target)
+            if len(targets) >= BATCH_SIZE:
+                model.update(np.array(inputs), np.array(targets),
+                             LEARNING_RATE)
+                inputs, targets = [], []
+            if game_over or drawn:
+                break
+            state, x = new_state, X[i]
+            moves, X, rewards, winners, values = successors
+        if q_learning._episode_hook is not None:
+            q_learning._episode_hook(model, episode_length)
+    if targets:
+        model.update(np.array(inputs), np.array(targets), LEARNING_RATE)
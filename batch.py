@@ -0,0 +1,222 @@
+'''
+batch.py
+
+Vectorized scoring of many checkers positions at once with NumPy. Positions
+are encoded as rows of piece values, one column per square, so material,
+king counts, terminal checks, rewards, hashes and q value lookups run as
+array operations over a whole move list or batch of positions.
+
+The approximate learner trains and plays through this module (see
+approx_q). The tabular trainer and player.move do not: for one position's
+handful of moves the array setup costs more than it saves. On an 8x8
+board, scoring a position's moves takes about 26 us in
+q_learning._best_action against 170 us in evaluate_successors. move is
+kept for comparing the two.
+'''
+
+from random import randint
+
+import numpy as np
+
+from q_table import MappedQ, q_key
+from state import Piece, Player, zobrist_table
+
+_zobrist_arrays = {}
+# piece values seen from the other side, see state.flipped_zobrist_table
+_SWAPPED_COLOR = np.array([Piece.EMPTY, Piece.RED_PAWN, Piece.BLACK_PAWN,
+                           Piece.RED_KING, Piece.BLACK_KING], dtype=np.int8)
+
+
+def zobrist_arrays(board_size):
+    """Returns the zobrist keys as a (squares, pieces) uint64 array."""
+    arrays = _zobrist_arrays.get(board_size)
+    if arrays is None:
+        keys, side = zobrist_table(board_size)
+        arrays = _zobrist_arrays[board_size] = (
+            np.array(keys, dtype=np.uint64), np.uint64(side))
+    return arrays
+
+
+def encode(states):
+    """Encodes states as (boards, whose_move) arrays."""
+    boards = np.array([[piece for row in state.board for piece in row]
+                       for state in states], dtype=np.int8)
+    whose_move = np.array([state.whose_move for state in states],
+                          dtype=np.int8)
+    return boards, whose_move
+
+
+def encode_successors(state, moves=None):
+    """Encodes the positions after each legal move of state.
+
+    Returns (moves, boards, whose_move, kills) where kills is the number of
+    pieces each move captures.
+    """
+    if moves is None:
+        moves = state.legal_moves()
+    parents, parent_moves = encode([state])
+    owners = np.zeros(len(moves), dtype=np.intp)
+    boards, whose_move, kills = _apply_moves(parents, parent_moves, owners,
+                                             moves, state.board_size)
+    return moves, boards, whose_move, kills
+
+
+def encode_all_successors(states):
+    """encode_successors for many states of one board size at once.
+
+    Returns (move lists, boards, whose_move, kills, owners) where the rows
+    hold the successors of every state in turn and owners is the index of
+    the state each row came from.
+    """
+    move_lists = [state.legal_moves() for state in states]
+    moves = [move_info for moves in move_lists for move_info in moves]
+    parents, parent_moves = encode(states)
+    owners = np.repeat(np.arange(len(states)),
+                       [len(moves) for moves in move_lists])
+    boards, whose_move, kills = _apply_moves(parents, parent_moves, owners,
+                                             moves, states[0].board_size)
+    return move_lists, boards, whose_move, kills, owners
+
+
+def _apply_moves(parents, parent_moves, owners, moves, size):
+    """Plays moves[i] on a copy of parents[owners[i]]."""
+    n = len(moves)
+    boards = parents[owners]
+    rows = np.arange(n)
+    origins = np.array([m.steps[0].y * size + m.steps[0].x for m in moves],
+                       dtype=np.intp)
+    dests = np.array([m.steps[-1].y * size + m.steps[-1].x for m in moves],
+                     dtype=np.intp)
+    kill_rows = np.array([i for i, m in enumerate(moves) for _ in m.kills],
+                         dtype=np.intp)
+    kill_squares = np.array([y * size + x for m in moves for x, y in m.kills],
+                            dtype=np.intp)
+
+    pieces = boards[rows, origins]
+    # pawns that finish on the first or last row are crowned
+    last_row = (dests // size == 0) | (dests // size == size - 1)
+    crowned = last_row & ((pieces == Piece.BLACK_PAWN) |
+                          (pieces == Piece.RED_PAWN))
+    pieces = np.where(crowned, pieces + 2, pieces).astype(np.int8)
+    boards[rows, origins] = Piece.EMPTY
+    boards[rows, dests] = pieces
+    boards[kill_rows, kill_squares] = Piece.EMPTY
+
+    whose_move = (parent_moves[owners] % 2 + 1).astype(np.int8)
+    kills = np.bincount(kill_rows, minlength=n)
+    return boards, whose_move, kills
+
+
+def hashes(boards, whose_move, board_size):
+    """Zobrist hashes of encoded positions, equal to State.generate_hash."""
+    keys, side = zobrist_arrays(board_size)
+    squares = np.arange(boards.shape[1])
+    h = np.bitwise_xor.reduce(keys[squares, boards], axis=1)
+    return np.where(whose_move == Player.BLACK, h ^ side, h)
+
+
+def canonical_hashes(boards, whose_move, board_size):
+    """Vectorized State.canonical_hash: returns (hashes, signs)."""
+    h = hashes(boards, whose_move, board_size)
+    flipped = hashes(_SWAPPED_COLOR[boards[:, ::-1]], whose_move % 2 + 1,
+                     board_size)
+    use_flipped = flipped < h
+    return np.where(use_flipped, flipped, h), np.where(use_flipped, -1, 1)
+
+
+def piece_counts(boards):
+    """Returns an (N, len(Piece)) array of piece counts, like piece_counts."""
+    return np.stack([(boards == piece).sum(axis=1)
+                     for piece in range(len(Piece))], axis=1)
+
+
+def winners(counts, whose_move, has_moves=None):
+    """Vectorized is_game_over: the winning Player per row, or 0.
+
+    Without has_moves only positions where a side has no pieces left are
+    detected; pass a boolean array to also catch players that cannot move.
+    """
+    reds = counts[:, Piece.RED_PAWN] + counts[:, Piece.RED_KING]
+    blacks = counts[:, Piece.BLACK_PAWN] + counts[:, Piece.BLACK_KING]
+    result = np.zeros(len(counts), dtype=np.int8)
+    if has_moves is not None:
+        result = np.where(has_moves, result, whose_move % 2 + 1)
+    result = np.where(blacks == 0, Player.RED, result)
+    return np.where(reds == 0, Player.BLACK, result).astype(np.int8)
+
+
+def rewards(counts, whose_move, kills, winner):
+    """Vectorized q_learning._reward for positions reached by a move."""
+    red_to_move = whose_move == Player.RED
+    kings = np.where(red_to_move, counts[:, Piece.RED_KING],
+                     counts[:, Piece.BLACK_KING])
+    reward = np.where(red_to_move, kills + kings, -(kills + kings))
+    reward = np.where(winner == Player.RED, 100, reward)
+    return np.where(winner == Player.BLACK, -100, reward)
+
+
+def lookup(Q, keys):
+    """Gathers (q, n) for an array of hashes; missing q values are nan."""
+    if isinstance(Q, MappedQ):
+        table_keys, q_values, visits = (np.frombuffer(a, dtype=d) for a, d in
+                                        zip(Q.arrays(), (np.uint64,
+                                                         np.float32,
+                                                         np.uint32)))
+        if len(table_keys) == 0:
+            return np.full(len(keys), np.nan), np.zeros(len(keys), np.int64)
+        i = np.minimum(np.searchsorted(table_keys, keys),
+                       len(table_keys) - 1)
+        found = table_keys[i] == keys
+        return (np.where(found, q_values[i], np.nan),
+                np.where(found, visits[i], 0))
+    q = np.full(len(keys), np.nan)
+    n = np.zeros(len(keys), dtype=np.int64)
+    for i, key in enumerate(keys.tolist()):
+        entry = Q.get(key)
+        if entry is not None:
+            q[i], n[i] = entry
+    return q, n
+
+
+def evaluate_successors(state, Q):
+    """Scores every legal move of state in one batch.
+
+    Returns a dict of the moves and arrays of their table keys, q values,
+    visit counts, rewards and winners.
+    """
+    moves, boards, whose_move, kills = encode_successors(state)
+    counts = piece_counts(boards)
+    winner = winners(counts, whose_move)
+    if getattr(Q, 'canonical', False):
+        keys, signs = canonical_hashes(boards, whose_move, state.board_size)
+    else:
+        keys = hashes(boards, whose_move, state.board_size)
+        signs = 1
+    q, n = lookup(Q, keys)
+    q = q * signs
+    return {'moves': moves, 'hashes': keys, 'q': q, 'n': n,
+            'rewards': rewards(counts, whose_move, kills, winner),
+            'winners': winner}
+
+
+def choose_move(maximize, state, moves, q, Q_VALUES):
+    """Picks the move player.move would from scored moves of state.
+
+    Returns ((new_state, move_info), q_value); the first best known move
+    wins ties and a random move is played when no successor is known.
+    """
+    known = ~np.isnan(q)
+    if not known.any():
+        move_info = moves[randint(0, len(moves) - 1)]
+        new_state = state.move(move_info)
+        return (new_state, move_info), \
+            Q_VALUES.get(q_key(Q_VALUES, new_state)[0]) or 0
+    i = int(np.nanargmax(q) if maximize else np.nanargmin(q))
+    return (state.move(moves[i]), moves[i]), float(q[i])
+
+
+def move(maximize, state, Q_VALUES):
+    """player.move scored in one batch; same result and tie breaking."""
+    scores = evaluate_successors(state, Q_VALUES)
+    return choose_move(maximize, state, scores['moves'], scores['q'],
+                       Q_VALUES)
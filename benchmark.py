@@ -0,0 +1,279 @@
+'''
+benchmark.py
+
+Headless benchmarks for the checkers engine and training. Measures perft node
+counts and speed, hashing speed, q learning updates, self play games and
+tree search playouts per second, and prints the results as JSON.
+
+    python benchmark.py --board-sizes 8 10 --depth 4 --output bench.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from random import Random, seed
+from time import perf_counter
+
+import player
+from bitboard import BitboardState
+from mcts import MCTSPlayer
+from q_learning import q_learning
+from state import Player, State, zobrist_hash
+
+BENCH_SETTINGS = {
+    'Q_GAMES': 10,
+    'LEARNING_RATE': .8,
+    'DISCOUNT': .5,
+    'EXPLORE_PROB': .4
+}
+# most milliseconds a headless command may add to the start of python
+STARTUP_TARGET_MS = 75
+# what a short job or a worker runs first, timed in a fresh interpreter
+STARTUP_COMMANDS = {
+    'import_player': ['-c', 'import player'],
+    'import_q_learning': ['-c', 'import q_learning'],
+    'cli_help': ['cli.py', '--help'],
+    'cli_train_help': ['cli.py', 'train', '--help'],
+    'cli_evaluate_help': ['cli.py', 'evaluate', '--help']
+}
+
+
+def perft(state, depth):
+    """Counts the positions reachable in exactly depth moves."""
+    if depth == 0:
+        return 1
+    return sum(perft(s, depth - 1) for s, _ in state.generate_successors())
+
+
+def bitboard_perft(state, depth):
+    """perft on the bitboard engine."""
+    if depth == 0:
+        return 1
+    return sum(bitboard_perft(state.apply(path, kills), depth - 1)
+               for path, kills in state.generate_paths())
+
+
+def midgame_positions(board_size, count=4, plies=12, rng_seed=0):
+    """Plays seeded random moves from the start to get mid game positions."""
+    rng = Random(rng_seed)
+    positions = []
+    while len(positions) < count:
+        state = State(board_size=board_size)
+        for _ in range(plies):
+            moves = list(state.iter_moves())
+            if not moves:
+                break
+            state = state.move(rng.choice(moves))
+        else:
+            if not state.is_game_over():
+                positions.append(state)
+    return positions
+
+
+def _timed(function, *args):
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds > 0 else None
+
+
+def bench_perft(board_size, depth):
+    """perft from the initial position and a few mid game positions."""
+    positions = [('initial', State(board_size=board_size))]
+    positions += [('midgame-%d' % i, s)
+                  for i, s in enumerate(midgame_positions(board_size))]
+    results = []
+    for name, state in positions:
+        for engine, count, root in (
+                ('state', perft, state),
+                ('bitboard', bitboard_perft, BitboardState.from_state(state))):
+            nodes, seconds = _timed(count, root, depth)
+            results.append({'position': name, 'engine': engine,
+                            'depth': depth, 'nodes': nodes,
+                            'seconds': seconds,
+                            'nodes_per_sec': _rate(nodes, seconds)})
+    return results
+
+
+def bench_hash(board_size, repeat=200):
+    """Hashes per second over a set of positions."""
+    states = [State(board_size=board_size)] + midgame_positions(board_size)
+    start = perf_counter()
+    for _ in range(repeat):
+        for state in states:
+            state.generate_hash()
+    seconds = perf_counter() - start
+    # a full rehash is what a state pays when it is built from a raw board
+    start = perf_counter()
+    for state in states:
+        zobrist_hash(state.board, state.whose_move, board_size)
+    full_seconds = perf_counter() - start
+    hashes = repeat * len(states)
+    return {'hashes': hashes, 'seconds': seconds,
+            'hashes_per_sec': _rate(hashes, seconds),
+            'full_hashes_per_sec': _rate(len(states), full_seconds)}
+
+
+def bench_training(board_size, games):
+    """q learning updates per second, trained in a scratch directory."""
+    settings = dict(BENCH_SETTINGS, Q_GAMES=games)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            seed(0)
+            Q, seconds = _timed(q_learning, settings,
+                                State(board_size=board_size))
+        finally:
+            os.chdir(cwd)
+    # every entry starts with one visit and each update adds one
+    updates = sum(n for _, n in Q.values()) - len(Q)
+    return {'games': games, 'updates': updates, 'states': len(Q),
+            'seconds': seconds, 'updates_per_sec': _rate(updates, seconds),
+            'Q': Q}
+
+
+def bench_self_play(board_size, Q, games, max_moves=200):
+    """Games per second of player.move playing itself."""
+    seed(0)
+    moves = 0
+    start = perf_counter()
+    for _ in range(games):
+        state = State(board_size=board_size)
+        maximize = False
+        for _ in range(max_moves):
+            if state.is_game_over():
+                break
+            (state, _), _ = player.move(maximize, state, Q)
+            maximize = not maximize
+            moves += 1
+    seconds = perf_counter() - start
+    return {'games': games, 'moves': moves, 'max_moves': max_moves,
+            'seconds': seconds, 'games_per_sec': _rate(games, seconds),
+            'moves_per_sec': _rate(moves, seconds)}
+
+
+def bench_mcts(board_size, worker_counts, seconds=1.0):
+    """Playouts per second of MCTSPlayer by worker count and parallel mode.
+
+    Every run searches the same mid game position for seconds with a fresh
+    tree, after a short search from the start that starts the workers.
+    speedup is against the single process search, and cores is how many
+    the machine has, more workers than cores cannot run faster.
+    """
+    # a position with a single move is played without a search
+    state = next(s for s in midgame_positions(board_size, count=8)
+                 if len(s.legal_moves()) > 1)
+    maximize = state.whose_move == Player.RED
+    runs = []
+    serial_rate = None
+    for workers in worker_counts:
+        modes = ('serial',) if workers == 1 else ('leaf', 'root')
+        for mode in modes:
+            with MCTSPlayer(time_limit=0.1, workers=workers,
+                            root_parallel=mode == 'root') as mcts_player:
+                mcts_player.move(True, State(board_size=board_size))
+                mcts_player.time_limit = seconds
+                _, elapsed = _timed(mcts_player.move, maximize, state)
+                rate = _rate(mcts_player.playouts, elapsed)
+            if mode == 'serial':
+                serial_rate = rate
+            runs.append({'workers': workers, 'mode': mode,
+                         'playouts': mcts_player.playouts,
+                         'seconds': elapsed, 'playouts_per_sec': rate,
+                         'speedup': rate / serial_rate
+                         if rate and serial_rate else None})
+    return {'cores': os.cpu_count(), 'runs': runs}
+
+
+def bench_startup(runs=5):
+    """Milliseconds each startup command adds to starting python.
+
+    Every command is the fastest of runs tries. Also checks that none of the
+    headless modules import tkinter.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def fastest(args):
+        best = float('inf')
+        for _ in range(runs):
+            start = perf_counter()
+            subprocess.run([sys.executable] + args, cwd=here, check=True,
+                           stdout=subprocess.DEVNULL)
+            best = min(best, perf_counter() - start)
+        return 1000 * best
+
+    python_ms = fastest(['-c', 'pass'])
+    added = {name: fastest(args) - python_ms
+             for name, args in STARTUP_COMMANDS.items()}
+    check = subprocess.run(
+        [sys.executable, '-c', 'import sys, cli, q_learning, tournament, '
+         'benchmark, sweep, mcts; print("tkinter" in sys.modules)'],
+        cwd=here, check=True, capture_output=True, text=True)
+    return {'python_ms': python_ms, 'added_ms': added,
+            'target_ms': STARTUP_TARGET_MS,
+            'within_target': max(added.values()) <= STARTUP_TARGET_MS,
+            'imports_tkinter': check.stdout.strip() == 'True'}
+
+
+def run(board_sizes, depth, train_games, play_games, mcts_workers=None,
+        mcts_seconds=1.0):
+    """Runs every benchmark and returns the results as a dict.
+
+    mcts_workers are the worker counts tree search is timed with, by
+    default 1, 2 and powers of two up to the number of cores.
+    """
+    if mcts_workers is None:
+        mcts_workers = [1, 2]
+        while mcts_workers[-1] * 2 <= (os.cpu_count() or 1):
+            mcts_workers.append(mcts_workers[-1] * 2)
+    results = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'startup': bench_startup(),
+        'board_sizes': {}
+    }
+    for board_size in board_sizes:
+        training = bench_training(board_size, train_games)
+        Q = training.pop('Q')
+        results['board_sizes'][str(board_size)] = {
+            'perft': bench_perft(board_size, depth),
+            'hash': bench_hash(board_size),
+            'training': training,
+            'self_play': bench_self_play(board_size, Q, play_games),
+            'mcts': bench_mcts(board_size, mcts_workers, mcts_seconds)
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n')[2])
+    parser.add_argument('--board-sizes', type=int, nargs='+', default=[8])
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--train-games', type=int, default=10)
+    parser.add_argument('--play-games', type=int, default=10)
+    parser.add_argument('--mcts-workers', type=int, nargs='+',
+                        help='worker counts to time tree search with')
+    parser.add_argument('--mcts-seconds', type=float, default=1.0)
+    parser.add_argument('--output', help='write the JSON here, not stdout')
+    args = parser.parse_args(argv)
+    results = run(args.board_sizes, args.depth, args.train_games,
+                  args.play_games, args.mcts_workers, args.mcts_seconds)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
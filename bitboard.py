@@ -0,0 +1,208 @@
+'''
+bitboard.py
+
+A bitboard representation of a checkers state with a fast move generator.
+Only the playable dark squares are stored, one bit per square, numbered in
+the same row-major order that State.generate_successors scans the board.
+'''
+
+from geometry import BLACK_PAWN_RAYS, KING_RAYS, RED_PAWN_RAYS, geometry
+from state import Location, MoveInfo, Piece, Player, State
+
+
+class BitboardState:
+    """A checkers state stored as integer masks over the dark squares."""
+    __slots__ = ('black', 'red', 'kings', 'whose_move', 'board_size', 'geo')
+
+    def __init__(self, black, red, kings, whose_move=Player.BLACK,
+                 board_size=8, geo=None):
+        self.black = black
+        self.red = red
+        self.kings = kings
+        self.whose_move = whose_move
+        self.board_size = board_size
+        self.geo = geo or geometry(board_size)
+
+    @classmethod
+    def from_state(cls, state):
+        """Builds a bitboard from a list-of-lists State."""
+        geo = geometry(state.board_size)
+        black = red = kings = 0
+        for y in range(state.board_size):
+            for x in range(state.board_size):
+                piece = state.board[y][x]
+                if piece == Piece.EMPTY:
+                    continue
+                i = geo.index.get(Location(x, y))
+                if i is None:
+                    raise ValueError('piece on a light square at %d, %d' %
+                                     (x, y))
+                bit = 1 << i
+                if piece == Piece.BLACK_PAWN or piece == Piece.BLACK_KING:
+                    black |= bit
+                else:
+                    red |= bit
+                if piece == Piece.BLACK_KING or piece == Piece.RED_KING:
+                    kings |= bit
+        return cls(black, red, kings, state.whose_move, state.board_size)
+
+    def to_state(self):
+        """Converts back to a list-of-lists State."""
+        size = self.board_size
+        board = [[Piece.EMPTY for _ in range(size)] for _ in range(size)]
+        for i, (x, y) in enumerate(self.geo.locations):
+            bit = 1 << i
+            if self.black & bit:
+                board[y][x] = Piece.BLACK_KING if self.kings & bit \
+                    else Piece.BLACK_PAWN
+            elif self.red & bit:
+                board[y][x] = Piece.RED_KING if self.kings & bit \
+                    else Piece.RED_PAWN
+        return State(board=board, whose_move=self.whose_move, board_size=size)
+
+    def __repr__(self):
+        return repr(self.to_state())
+
+    def __eq__(self, other):
+        return (isinstance(other, BitboardState) and self.key() == other.key())
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def key(self):
+        """Returns a tuple that identifies the position."""
+        return (self.black, self.red, self.kings, int(self.whose_move),
+                self.board_size)
+
+    def get_piece(self, x, y):
+        """Returns the piece at the given coordinates on the board."""
+        i = self.geo.index.get(Location(x, y))
+        if i is None:
+            return Piece.EMPTY
+        bit = 1 << i
+        if self.black & bit:
+            return Piece.BLACK_KING if self.kings & bit else Piece.BLACK_PAWN
+        if self.red & bit:
+            return Piece.RED_KING if self.kings & bit else Piece.RED_PAWN
+        return Piece.EMPTY
+
+    def is_game_over(self):
+        """Same result as State.is_game_over."""
+        if not self.red:
+            return Player.BLACK
+        if not self.black:
+            return Player.RED
+        if not self.generate_paths():
+            return Player(self.whose_move % 2 + 1)
+        return 0
+
+    def generate_paths(self):
+        """Returns the legal moves as (path, kills) pairs of square indices.
+
+        Captures are mandatory; a capture continues along the first further
+        jump found, exactly as State.generate_moves does.
+        """
+        geo = self.geo
+        rays = geo.rays
+        promotion = geo.promotion
+        kings = self.kings
+        if self.whose_move == Player.BLACK:
+            own, opp, pawn_rays = self.black, self.red, rays[BLACK_PAWN_RAYS]
+        else:
+            own, opp, pawn_rays = self.red, self.black, rays[RED_PAWN_RAYS]
+        king_rays = rays[KING_RAYS]
+        empty = geo.full & ~(own | opp)
+
+        captures = []
+        pieces = own
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            sq = low.bit_length() - 1
+            is_king = kings & low
+            for mid, land in (king_rays if is_king else pawn_rays)[sq]:
+                if land < 0 or not (opp >> mid) & 1 or not (empty >> land) & 1:
+                    continue
+                path = [sq, land]
+                kills = [mid]
+                # the origin is vacated and the victim removed after each hop
+                hop_opp = opp & ~(1 << mid)
+                hop_empty = (empty | low | (1 << mid)) & ~(1 << land)
+                cur = land
+                crowned = is_king or (promotion >> land) & 1
+                found = True
+                while found:
+                    found = False
+                    for mid2, land2 in (king_rays if crowned
+                                        else pawn_rays)[cur]:
+                        if land2 >= 0 and (hop_opp >> mid2) & 1 and \
+                                (hop_empty >> land2) & 1:
+                            path.append(land2)
+                            kills.append(mid2)
+                            hop_opp &= ~(1 << mid2)
+                            hop_empty = (hop_empty | (1 << cur) |
+                                         (1 << mid2)) & ~(1 << land2)
+                            cur = land2
+                            crowned = crowned or (promotion >> land2) & 1
+                            found = True
+                            break
+                captures.append((path, kills))
+        if captures:
+            return captures
+
+        moves = []
+        pieces = own
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            sq = low.bit_length() - 1
+            for mid, _ in (king_rays if kings & low else pawn_rays)[sq]:
+                if (empty >> mid) & 1:
+                    moves.append(([sq, mid], ()))
+        return moves
+
+    def apply(self, path, kills):
+        """Returns the state after playing a (path, kills) move."""
+        origin = 1 << path[0]
+        dest = 1 << path[-1]
+        removed = 0
+        for k in kills:
+            removed |= 1 << k
+        kings = self.kings
+        if kings & origin or dest & self.geo.promotion:
+            kings = (kings & ~(origin | removed)) | dest
+        elif removed:
+            kings &= ~removed
+        if self.whose_move == Player.BLACK:
+            return BitboardState((self.black & ~origin) | dest,
+                                 self.red & ~removed, kings, Player.RED,
+                                 self.board_size, self.geo)
+        return BitboardState(self.black & ~removed,
+                             (self.red & ~origin) | dest, kings, Player.BLACK,
+                             self.board_size, self.geo)
+
+    def move_info(self, path, kills):
+        """Converts a (path, kills) pair into a MoveInfo."""
+        locations = self.geo.locations
+        return MoveInfo([locations[i] for i in path],
+                        [locations[i] for i in kills])
+
+    def generate_moves(self):
+        """Returns the legal moves as MoveInfo objects."""
+        return [self.move_info(path, kills)
+                for path, kills in self.generate_paths()]
+
+    def generate_successors(self):
+        """Returns (state, move_info) pairs like State.generate_successors."""
+        apply = self.apply
+        locations = self.geo.locations
+        return [(apply(path, kills),
+                 MoveInfo([locations[i] for i in path],
+                          [locations[i] for i in kills]))
+                for path, kills in self.generate_paths()]
+
+    def move(self, move_info):
+        """Plays a MoveInfo and returns the new bitboard."""
+        index = self.geo.index
+        return self.apply([index[loc] for loc in move_info.steps],
+                          [index[loc] for loc in move_info.kills])
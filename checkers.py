@@ -5,15 +5,20 @@ A manager for a checkers game.
 '''
 
 from copy import copy
-from time import *
-from tkinter import *
+from queue import Empty, Queue
+from threading import Thread
+from tkinter import (HORIZONTAL, Button, Canvas, Entry, Label, Scale, Tk,
+                     Toplevel)
 
 import player as player1
 import player as player2
 
-from display import *
-from q_learning import *
-from state import *
+from display import BoardView
+from game_log import GameWriter
+from opening_book import opening_book
+from q_learning import q_learning
+from state import GameHistory, Player, State
+from tablebase import tablebase
 
 player1_turn = True
 
@@ -24,6 +29,15 @@ ENABLE_GUI = True
 window_size = 500
 pieces = []
 sleep_time = .1
+# games without a winner after this many moves end in a draw
+max_moves = 160
+
+# played games are appended here, None to not log them
+GAME_LOG = 'logs/games.jsonl'
+# play the first moves from the opening book of the board size
+USE_OPENING_BOOK = True
+# play endgames perfectly once a tablebase is built, see tablebase.py
+USE_TABLEBASE = True
 
 # default q learning settings
 DEFAULT_SETTINGS = {
@@ -43,56 +57,105 @@ class Game():
     """Creates an instance of a checkers game."""
     def __init__(self):
         self.state = State(board_size=BOARD_SIZE)
-        self.start_time = perf_counter()
-
-    # run the game 
-    def play_game(self, Q_VALUES_1, Q_VALUES_2):
-        tk = Tk()
-        canvas = Canvas(tk, width=window_size + 200, height=window_size)
-        canvas.grid(row=0, column=0)
-
+        # built or loaded by run, which play_game calls off the Tk thread
+        self.book = None
+        self.tablebase = tablebase(BOARD_SIZE) if USE_TABLEBASE else None
+
+    def run(self, Q_VALUES_1, Q_VALUES_2, on_move=None):
+        """Plays the game to the end and returns the winner, 0 for none.
+
+        Games are drawn by the rules of GameHistory or after max_moves moves.
+        on_move is called with (state, move_info, q_val) after every move.
+        The first game of a board size may build its opening book here.
+        """
+        if USE_OPENING_BOOK and self.book is None:
+            self.book = opening_book(BOARD_SIZE)
         player1_turn = True
-        q_val = 0
-
-        exists_winner = True
-
-        def update():
-            display(canvas, self.state, q_val)
-            tk.update()
-            sleep(sleep_time)
-
-        print("---\nGame Start")
-
-        while not self.state.is_game_over():
+        initial_state = self.state
+        history = GameHistory(initial_state)
+        moves = []
+        q_values = []
+        for _ in range(max_moves):
+            if self.state.is_game_over():
+                break
             previous_state = self.state
+            # q, book and tablebase values are from red's point of view
+            maximize = self.state.whose_move == Player.RED
             if player1_turn:
                 (self.state, self.move_info), q_val = player1.move(
-                    True, self.state, Q_VALUES_1)
+                    maximize, self.state, Q_VALUES_1, self.book,
+                    self.tablebase)
                 player1_turn = False
             else:
                 (self.state, self.move_info), q_val = player2.move(
-                    False, self.state, Q_VALUES_2)
+                    maximize, self.state, Q_VALUES_2, self.book,
+                    self.tablebase)
                 player1_turn = True
-            if ENABLE_GUI:
-                update()
-            if (perf_counter() - self.start_time) > (sleep_time * 160):
-                exists_winner = False
+            moves.append(self.move_info)
+            q_values.append(q_val)
+            if on_move is not None:
+                on_move(self.state, self.move_info, q_val)
+            if history.push(previous_state, self.move_info, self.state):
                 break
-        display(canvas, self.state, q_val)
-        winner = "no winner"
-        if exists_winner:
-            winner = self.state.get_winner()
-        canvas.create_text(window_size + 100, 20,
-                           text="Winner: " + winner)
+        winner = self.state.is_game_over()
+        if GAME_LOG:
+            with GameWriter(GAME_LOG) as writer:
+                writer.write(initial_state, moves, q_values, winner)
+        return winner
+
+    # run the game
+    def play_game(self, Q_VALUES_1, Q_VALUES_2):
+        print("---\nGame Start")
+        if not ENABLE_GUI:
+            self._finish(self.run(Q_VALUES_1, Q_VALUES_2))
+            return
+
+        window = Toplevel()
+        canvas = Canvas(window, width=window_size + 200, height=window_size)
+        canvas.grid(row=0, column=0)
+        view = BoardView(canvas, self.state)
+
+        # the game is played on a worker thread and the moves are shown from
+        # the Tk thread by polling with after, so drawing never blocks play.
+        # The worker keeps moving on the state, so only the changed squares
+        # are queued, never the state itself
+        updates = Queue()
+
+        def play():
+            winner = self.run(
+                Q_VALUES_1, Q_VALUES_2,
+                on_move=lambda state, move_info, q_val: updates.put(
+                    (BoardView.changes(state, move_info), q_val)))
+            updates.put(winner)
+
+        def poll():
+            try:
+                update = updates.get_nowait()
+            except Empty:
+                canvas.after(int(sleep_time * 1000), poll)
+                return
+            if isinstance(update, tuple):
+                view.show(*update)
+                canvas.after(int(sleep_time * 1000), poll)
+            else:
+                view.show_winner(self._finish(update))
+
+        Thread(target=play, daemon=True).start()
+        canvas.after(0, poll)
+
+    def _finish(self, winner):
+        winner = self.state.get_winner() if winner else "no winner"
         print("Winner: " + winner)
+        return winner
 
 
 def main():
     """Runs the program."""
     options = Tk()
     options.update_idletasks()
-    Q_VALUES_1 = {}
-    Q_VALUES_2 = {}
+    # trained or loaded on the first game, or by Q Learn
+    Q_VALUES_1 = None
+    Q_VALUES_2 = None
 
     def update_settings():
         """Changes the settings for the game."""
@@ -103,13 +166,13 @@ def main():
         PLAYER_1_SETTINGS = {
             'Q_GAMES': int(q_games_1.get()),
             'LEARNING_RATE': float(lr_1.get()),
-            'DISCOUNT': .5,
+            'DISCOUNT': float(d_1.get()),
             'EXPLORE_PROB': float(ep_1.get())
         }
         PLAYER_2_SETTINGS = {
             'Q_GAMES': int(q_games_2.get()),
             'LEARNING_RATE': float(lr_2.get()),
-            'DISCOUNT': .5,
+            'DISCOUNT': float(d_2.get()),
             'EXPLORE_PROB': float(ep_2.get())
         }
         Q_VALUES_1 = q_learning(PLAYER_1_SETTINGS, initial_state=State(board_size=BOARD_SIZE))
@@ -117,6 +180,8 @@ def main():
 
     def play():
         """Plays one game between the two players."""
+        if Q_VALUES_1 is None:
+            update_settings()
         game = Game()
         game.play_game(Q_VALUES_1, Q_VALUES_2)
 
@@ -154,18 +219,29 @@ def main():
     ep_2.grid(row=2, column=3)
     ep_2.set(PLAYER_2_SETTINGS['EXPLORE_PROB'])
 
-    Label(options, text='Board Size:').grid(row=3, column=0)
+    Label(options, text='Black Discount:').grid(row=3, column=0)
+    d_1 = Scale(options, from_=0, to=1, resolution=.1)
+    d_1.config(orient=HORIZONTAL)
+    d_1.grid(row=3, column=1)
+    d_1.set(PLAYER_1_SETTINGS['DISCOUNT'])
+    Label(options, text='Red Discount:').grid(row=3, column=2)
+    d_2 = Scale(options, from_=0, to=1, resolution=.1)
+    d_2.config(orient=HORIZONTAL)
+    d_2.grid(row=3, column=3)
+    d_2.set(PLAYER_2_SETTINGS['DISCOUNT'])
+
+    Label(options, text='Board Size:').grid(row=4, column=0)
     b_size = Entry(options)
     b_size.config(width=3)
     b_size.insert(0, BOARD_SIZE)
-    b_size.grid(row=3, column=1)
+    b_size.grid(row=4, column=1)
 
     q_learn = Button(options, text="Q Learn", command=update_settings)
-    q_learn.grid(row=4, column=0)
+    q_learn.grid(row=5, column=0)
     play_game = Button(options, text="Play Game", command=play)
-    play_game.grid(row=4, column=1)
-    update_settings()
+    play_game.grid(row=5, column=1)
     options.mainloop()
-    
 
-main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+cli.py
+
+One command line for the headless tools: training, evaluation, benchmarks
+and the rest. A command's module is only imported when the command runs and
+none of them import tkinter, so short jobs start fast and everything works
+on machines without a display.
+
+    python cli.py train --games 5000 --set WORKERS=4 SEED=1
+    python cli.py evaluate cache/a.save cache/b.save --games 200
+    python cli.py bench --board-sizes 8
+'''
+
+import sys
+from importlib import import_module
+
+# command: (module with a main(argv), description)
+COMMANDS = {
+    'train': ('q_learning', 'train a q table'),
+    'evaluate': ('tournament', 'play two saved tables against each other'),
+    'bench': ('benchmark', 'measure the engine, training and startup'),
+    'sweep': ('sweep', 'train and rank many settings'),
+    'replay': ('game_log', 'train a q table from logged games'),
+    'tablebase': ('tablebase', 'build an endgame tablebase')
+}
+
+
+def usage():
+    lines = ['usage: cli.py COMMAND [ARGS...]', '', 'commands:']
+    for name, (_, description) in COMMANDS.items():
+        lines.append('  %-10s %s' % (name, description))
+    lines.append('')
+    lines.append('cli.py COMMAND --help shows the arguments of a command')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+        if argv:
+            # so the usage of a command reads cli.py COMMAND
+            sys.argv[0] = '%s %s' % (sys.argv[0], argv[0])
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    if argv[0] not in COMMANDS:
+        print('unknown command %r\n\n%s' % (argv[0], usage()),
+              file=sys.stderr)
+        return 2
+    module = import_module(COMMANDS[argv[0]][0])
+    module.main(argv[1:])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,8 +5,8 @@ A graphical display for a checkers game using tkinter.
 Little pieces are pawns, big pieces are kings.
 '''
 
-from tkinter import *
-from state import *
+from geometry import geometry
+from state import Piece
 
 window_size = 500
 
@@ -17,52 +17,45 @@ def draw_board(canvas, board_size):
     """Draws the checkerboard."""
     cell_width = window_size / board_size
     cell_height = window_size / board_size
-    for col in range(board_size):
-        for row in range(board_size):
-            if (row + col) % 2 == 0:
-                canvas.create_rectangle(col * cell_width, row * cell_height,
-                                        (col + 1) * cell_width, (row + 1) *
-                                        cell_height, fill='gray')
+    for col, row in geometry(board_size).light_squares:
+        canvas.create_rectangle(col * cell_width, row * cell_height,
+                                (col + 1) * cell_width, (row + 1) *
+                                cell_height, fill='gray')
 
 
 def erase_pieces(canvas, pieces):
     """Deletes all game pieces from the game gui."""
     for piece in pieces:
         canvas.delete(piece)
-        pieces.remove(piece)
+    pieces.clear()
+
+
+def draw_piece(canvas, x, y, piece, board_size):
+    """Draws one piece on a square and returns its canvas item, or None."""
+    if piece == Piece.EMPTY:
+        return None
+    if piece == Piece.RED_KING or piece == Piece.BLACK_KING:
+        inset = 0.1 * window_size / board_size
+    else:
+        inset = 0.25 * window_size / board_size
+    color = 'red' if piece == Piece.RED_KING or piece == Piece.RED_PAWN \
+        else 'black'
+    start_x = x * window_size / board_size
+    start_y = y * window_size / board_size
+    end_x = start_x + window_size / board_size
+    end_y = start_y + window_size / board_size
+    return canvas.create_oval(start_x + inset, start_y + inset,
+                              end_x - inset, end_y - inset, fill=color)
 
 
 def draw_pieces(canvas, board, pieces):
     """Draws all pieces on the gui from a provided board."""
     board_size = board.board_size
-    king_size = 0.1 * window_size / board_size
-    pawn_size = 0.25 * window_size / board_size
-
     for x in range(board_size):
         for y in range(board_size):
-            start_x = (x) * window_size / board_size
-            start_y = ((y) * window_size / board_size)
-            end_x = start_x + window_size / board_size
-            end_y = start_y + window_size / board_size
-
-            a = None
-            if board.get_piece(x, y) == Piece.RED_KING:
-                a = canvas.create_oval(start_x + king_size, start_y + king_size,
-                                       end_x - king_size, end_y - king_size,
-                                       fill='red')
-            elif board.get_piece(x, y) == Piece.RED_PAWN:
-                a = canvas.create_oval(start_x + pawn_size, start_y + pawn_size,
-                                       end_x - pawn_size, end_y - pawn_size,
-                                       fill='red')
-            elif board.get_piece(x, y) == Piece.BLACK_KING:
-                a = canvas.create_oval(start_x + king_size, start_y + king_size,
-                                       end_x - king_size, end_y - king_size,
-                                       fill='black')
-            elif board.get_piece(x, y) == Piece.BLACK_PAWN:
-                a = canvas.create_oval(start_x + pawn_size, start_y + pawn_size,
-                                       end_x - pawn_size, end_y - pawn_size,
-                                       fill='black')
-            pieces.append(a)
+            a = draw_piece(canvas, x, y, board.get_piece(x, y), board_size)
+            if a is not None:
+                pieces.append(a)
 
 
 def display(canvas, board, q_val):
@@ -73,3 +66,53 @@ def display(canvas, board, q_val):
     draw_pieces(canvas, board, pieces)
     canvas.create_text(window_size + 100, 50,
                        text="Q Value of current board: " + str(q_val))
+
+
+class BoardView:
+    """Draws the board once, then only redraws the squares a move changes."""
+    def __init__(self, canvas, state):
+        self.canvas = canvas
+        self.board_size = state.board_size
+        draw_board(canvas, self.board_size)
+        self.items = {}
+        for y in range(self.board_size):
+            for x in range(self.board_size):
+                self._draw(x, y, state.get_piece(x, y))
+        self.q_text = canvas.create_text(
+            window_size + 100, 50, text="Q Value of current board: 0")
+        self.winner_text = canvas.create_text(window_size + 100, 20, text='')
+
+    def _draw(self, x, y, piece):
+        item = self.items.pop((x, y), None)
+        if item is not None:
+            self.canvas.delete(item)
+        item = draw_piece(self.canvas, x, y, piece, self.board_size)
+        if item is not None:
+            self.items[x, y] = item
+
+    @staticmethod
+    def changes(state, move_info):
+        """Returns (x, y, piece) of the squares the move to state changed.
+
+        The list does not refer to state, so it can be handed to the Tk
+        thread while the game goes on with state.
+        """
+        origin = move_info.steps[0]
+        dest = move_info.steps[-1]
+        return [(x, y, state.get_piece(x, y))
+                for x, y in [origin] + list(move_info.kills) + [dest]]
+
+    def update(self, state, move_info, q_val):
+        """Shows the move that led to state."""
+        self.show(self.changes(state, move_info), q_val)
+
+    def show(self, changes, q_val):
+        """Shows squares returned by changes."""
+        for x, y, piece in changes:
+            self._draw(x, y, piece)
+        self.canvas.itemconfigure(
+            self.q_text, text="Q Value of current board: " + str(q_val))
+
+    def show_winner(self, winner):
+        """Shows the result of the game."""
+        self.canvas.itemconfigure(self.winner_text, text="Winner: " + winner)
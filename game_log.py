@@ -0,0 +1,140 @@
+'''
+game_log.py
+
+Append only logs of played games. Every game is one JSON line holding the
+start position, the moves as square indices, the q value of each move and
+the winner. Logs ending in .gz are gzip compressed. Logged games are read
+back one at a time, so replaying them through the q learning update never
+holds a whole log in memory.
+
+    python game_log.py logs/games.jsonl --learning-rate .8 --discount .5
+'''
+
+import json
+from os import makedirs
+from os.path import dirname
+
+from state import Location, MoveInfo, Piece, Player, State
+
+
+def _open(file_location, mode, buffering=-1):
+    if is_compressed(file_location):
+        # imported here, most logs are plain text
+        import gzip
+        return gzip.open(file_location, mode)
+    return open(file_location, mode, buffering)
+
+
+def is_compressed(file_location):
+    """True for gzip logs, which only one process may append to at a time."""
+    return file_location.endswith('.gz')
+
+
+def encode_move(move_info, board_size):
+    """Returns a move as [steps, kills] lists of square indices."""
+    return [[y * board_size + x for x, y in move_info.steps],
+            [y * board_size + x for x, y in move_info.kills]]
+
+
+def decode_move(move, board_size):
+    """Turns an encode_move list back into a MoveInfo."""
+    steps, kills = move
+    return MoveInfo(steps=[Location(*divmod(i, board_size)[::-1])
+                           for i in steps],
+                    kills=[Location(*divmod(i, board_size)[::-1])
+                           for i in kills])
+
+
+class GameWriter:
+    """Appends game records to a log file, one line per game.
+
+    A plain text log is written unbuffered, one write per record, so
+    several processes can append to the same log. A gzip log compresses
+    across records and must only have one writer at a time.
+    """
+    def __init__(self, file_location):
+        if dirname(file_location):
+            makedirs(dirname(file_location), exist_ok=True)
+        self.file = _open(file_location, 'ab', buffering=0)
+
+    def write(self, initial_state, moves, q_values, winner):
+        """Logs a game played from initial_state; winner is 0 for a draw."""
+        size = initial_state.board_size
+        record = {
+            'board_size': size,
+            'start': ''.join(str(int(piece)) for row in initial_state.board
+                             for piece in row),
+            'whose_move': int(initial_state.whose_move),
+            'moves': [encode_move(m, size) for m in moves],
+            'q': [round(float(q), 6) for q in q_values],
+            'winner': int(winner)
+        }
+        self.file.write(json.dumps(record, separators=(',', ':')).encode() +
+                        b'\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_games(file_location):
+    """Yields the logged game records one at a time."""
+    with _open(file_location, 'rb') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def initial_state(record):
+    """Returns the State a logged game started from."""
+    size = record['board_size']
+    start = record['start']
+    board = [[Piece(int(start[y * size + x])) for x in range(size)]
+             for y in range(size)]
+    return State(board=board, whose_move=Player(record['whose_move']),
+                 board_size=size)
+
+
+def replay(records):
+    """Yields (state, move_info, new_state, q_value) for every logged move."""
+    for record in records:
+        size = record['board_size']
+        state = initial_state(record)
+        for move, q_value in zip(record['moves'], record['q']):
+            move_info = decode_move(move, size)
+            new_state = state.move(move_info)
+            yield state, move_info, new_state, q_value
+            state = new_state
+
+
+def main(argv=None):
+    # imported here, q_learning imports this module to log its games
+    import argparse
+    from q_learning import replay_training, save_q
+
+    parser = argparse.ArgumentParser(description='Trains a q table from '
+                                     'logged games.')
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--learning-rate', type=float, default=.8)
+    parser.add_argument('--discount', type=float, default=.5)
+    parser.add_argument('--passes', type=int, default=1)
+    parser.add_argument('--output', default='cache/replay.save')
+    args = parser.parse_args(argv)
+    settings = {'LEARNING_RATE': args.learning_rate,
+                'DISCOUNT': args.discount}
+    Q = {}
+    for _ in range(args.passes):
+        for file_location in args.logs:
+            replay_training(Q, settings, replay(read_games(file_location)))
+    save_q(Q, args.output)
+    print('%d states saved to %s' % (len(Q), args.output))
+
+
+if __name__ == '__main__':
+    main()
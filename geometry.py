@@ -0,0 +1,96 @@
+'''
+geometry.py
+
+Lookup tables for one board size, built once and shared by the state, the
+bitboard engine and the display: the playable squares, the diagonal steps
+and jumps from every square, the promotion rows and the starting layout.
+'''
+
+from collections import namedtuple
+
+Location = namedtuple('Location', ['x', 'y'])
+
+# diagonal directions, in the order moves are tried
+DIRECTIONS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+# the directions each piece moves along, indexed by Piece value: empty,
+# black pawn, red pawn, black king, red king
+PIECE_DIRECTIONS = ((), DIRECTIONS[:2], DIRECTIONS[2:], DIRECTIONS,
+                    DIRECTIONS)
+
+# indices into Geometry.rays
+BLACK_PAWN_RAYS = 0
+RED_PAWN_RAYS = 1
+KING_RAYS = 2
+
+_geometries = {}
+
+
+class Geometry:
+    """Square numbering and diagonal tables for one board size."""
+    def __init__(self, board_size):
+        self.board_size = board_size
+        self.grid = tuple(tuple(Location(x, y) for x in range(board_size))
+                          for y in range(board_size))
+        self.promotion_rows = (0, board_size - 1)
+
+        # the playable dark squares, numbered row by row
+        self.locations = tuple(self.grid[y][x] for y in range(board_size)
+                               for x in range(board_size) if x % 2 != y % 2)
+        self.light_squares = tuple(self.grid[y][x] for y in range(board_size)
+                                   for x in range(board_size)
+                                   if x % 2 == y % 2)
+        self.index = {loc: i for i, loc in enumerate(self.locations)}
+        self.n_squares = len(self.locations)
+        self.full = (1 << self.n_squares) - 1
+
+        self.promotion = 0
+        for i, (x, y) in enumerate(self.locations):
+            if y in self.promotion_rows:
+                self.promotion |= 1 << i
+
+        # initial_board[y][x] is the Piece value on the square at the start
+        self.initial_board = tuple(
+            tuple(0 if x % 2 == y % 2 else
+                  1 if y < board_size / 2 - 1 else
+                  2 if y >= board_size / 2 + 1 else 0
+                  for x in range(board_size))
+            for y in range(board_size))
+
+        # steps[piece][y][x] is a tuple of (neighbor, jump) Locations along
+        # each diagonal the piece moves on, jump is None off the board
+        self.steps = tuple(
+            tuple(tuple(tuple((self.at(x + dx, y + dy),
+                               self.at(x + 2 * dx, y + 2 * dy))
+                              for dx, dy in directions
+                              if self.at(x + dx, y + dy) is not None)
+                        for x in range(board_size))
+                  for y in range(board_size))
+            for directions in PIECE_DIRECTIONS)
+
+        # rays[kind][square] is a tuple of (neighbor, jump) pairs of square
+        # numbers, jump is -1 when the landing square falls off the board
+        black, red, king = [], [], []
+        for x, y in self.locations:
+            pairs = []
+            for dx, dy in DIRECTIONS:
+                neighbor = self.index.get(Location(x + dx, y + dy), -1)
+                jump = self.index.get(Location(x + 2 * dx, y + 2 * dy), -1)
+                pairs.append((neighbor, jump) if neighbor >= 0 else None)
+            black.append(tuple(p for p in pairs[:2] if p is not None))
+            red.append(tuple(p for p in pairs[2:] if p is not None))
+            king.append(tuple(p for p in pairs if p is not None))
+        self.rays = (tuple(black), tuple(red), tuple(king))
+
+    def at(self, x, y):
+        """Returns the Location of a square, None if it is off the board."""
+        if 0 <= x < self.board_size and 0 <= y < self.board_size:
+            return self.grid[y][x]
+        return None
+
+
+def geometry(board_size):
+    """Returns the cached geometry for a board size."""
+    geo = _geometries.get(board_size)
+    if geo is None:
+        geo = _geometries[board_size] = Geometry(board_size)
+    return geo
@@ -0,0 +1,143 @@
+'''
+inference.py
+
+Serves moves for many games at once from one q table. The table is loaded
+once and the successors of every position in a batch are encoded, hashed and
+looked up together with array operations. BatchServer groups requests from
+asyncio tasks that arrive within a short window into one batch.
+
+    engine = InferenceEngine('cache/table.save')
+    server = BatchServer(engine)
+    (new_state, move_info), q_value = await server.move(True, state)
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import batch
+from q_learning import load_q
+
+
+class InferenceEngine:
+    """Chooses moves for batches of positions from one loaded q table.
+
+    Q_VALUES can also be a model with a successor_values method, such as the
+    approx_q.LinearQ that load_q returns for weights, which values the moves
+    of each position itself.
+    """
+    def __init__(self, Q_VALUES):
+        if isinstance(Q_VALUES, str):
+            Q_VALUES = load_q(Q_VALUES)
+        self.Q_VALUES = Q_VALUES
+        self.canonical = getattr(Q_VALUES, 'canonical', False)
+
+    def score(self, states):
+        """Returns (moves, q values) for each state; unknown q values are nan.
+
+        All successors of the positions of one board size are hashed and
+        looked up in a single pass.
+        """
+        if hasattr(self.Q_VALUES, 'successor_values'):
+            scored = []
+            for state in states:
+                moves, values = self.Q_VALUES.successor_values(state)
+                scored.append((moves, np.array(values, dtype=float)))
+            return scored
+        scored = [None] * len(states)
+        by_size = {}
+        for i, state in enumerate(states):
+            by_size.setdefault(state.board_size, []).append(i)
+        for board_size, indices in by_size.items():
+            move_lists, boards, whose_move, _, _ = \
+                batch.encode_all_successors([states[i] for i in indices])
+            if self.canonical:
+                keys, signs = batch.canonical_hashes(boards, whose_move,
+                                                     board_size)
+            else:
+                keys = batch.hashes(boards, whose_move, board_size)
+                signs = 1
+            q, _ = batch.lookup(self.Q_VALUES, keys)
+            q = q * signs
+            ends = np.cumsum([len(moves) for moves in move_lists])[:-1]
+            for i, moves, state_q in zip(indices, move_lists,
+                                         np.split(q, ends)):
+                scored[i] = (moves, state_q)
+        return scored
+
+    def move_batch(self, requests):
+        """player.move for a list of (maximize, state) requests.
+
+        Returns one ((new_state, move_info), q_value) per request, chosen
+        exactly as player.move would.
+        """
+        states = [state for _, state in requests]
+        results = []
+        for (maximize, state), (moves, q) in zip(requests, self.score(states)):
+            if not moves:
+                raise ValueError('no legal moves, the game is over')
+            results.append(batch.choose_move(maximize, state, moves, q,
+                                             self.Q_VALUES))
+        return results
+
+
+class BatchServer:
+    """Groups move requests from asyncio tasks into engine batches.
+
+    A batch is scored once max_batch requests are waiting or max_delay
+    seconds after its first request arrived, whichever comes first. Batches
+    run one at a time on a worker thread so the event loop keeps accepting
+    requests meanwhile.
+    """
+    def __init__(self, engine, max_batch=256, max_delay=0.002):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.requests = 0
+        self._pending = []
+        self._timer = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def move(self, maximize, state):
+        """Returns ((new_state, move_info), q_value) like player.move."""
+        if state.is_game_over():
+            raise ValueError('no legal moves, the game is over')
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((maximize, state, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        requests = [(maximize, state) for maximize, state, _ in pending]
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self._executor, self.engine.move_batch, requests)
+        except Exception as exc:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        self.batches += 1
+        self.requests += len(pending)
+        for (_, _, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+    def close(self):
+        """Stops the worker thread once running batches are done."""
+        self._executor.shutdown()
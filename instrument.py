@@ -0,0 +1,216 @@
+'''
+instrument.py
+
+Optional counters and timers for the engine and the training loop. Nothing
+is measured until enable() wraps the hot functions, and disable() puts the
+originals back, so there is no cost while it is off. When enabled, training
+sends out a structured snapshot every few seconds with call counts and
+times, the q table size and hit rate and the episode lengths. Times include
+the calls nested inside. With WORKERS > 1 the calls are only counted in the
+process that makes them, but the workers report their games with every
+merge, so the episodes of the parent's snapshot cover the whole run.
+
+    import instrument
+    instrument.enable(interval=5, output='logs/stats.jsonl')
+    q_learning(settings)
+    print(instrument.snapshot())
+'''
+
+import json
+import sys
+from collections.abc import MutableMapping
+from os import getpid
+from time import perf_counter, time
+
+import player
+import q_learning
+from q_table import BoundedQ
+from state import State
+
+# the functions that are timed, as (owner, attribute name)
+TARGETS = (
+    (State, 'generate_successors'),
+    (State, 'legal_moves'),
+    (State, 'make_move'),
+    (State, 'unmake_move'),
+    (State, 'move'),
+    (State, 'canonical_hash'),
+    (State, 'is_game_over'),
+    (q_learning, '_best_action'),
+    (q_learning, '_explore_action'),
+    (q_learning, '_reward'),
+    (player, 'move')
+)
+
+_originals = {}
+_calls = {}
+_tables = []
+_episodes = {'games': 0, 'moves': 0, 'longest': 0, 'last': 0}
+_output = None
+_interval = None
+_last_emit = None
+
+
+class CountingQ(MutableMapping):
+    """Wraps a q table and counts lookups that hit or miss.
+
+    Membership tests and copies through items() are not counted. A BoundedQ
+    counts its own lookups and is not wrapped.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.canonical = getattr(table, 'canonical', False)
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, key):
+        try:
+            value = self.table[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.table[key] = value
+
+    def __delitem__(self, key):
+        del self.table[key]
+
+    def __contains__(self, key):
+        return key in self.table
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+    def items(self):
+        return self.table.items()
+
+
+def _timed(name, function):
+    stats = _calls.setdefault(name, [0, 0.0])
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats[0] += 1
+            stats[1] += perf_counter() - start
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def _counting_table(settings):
+    table = _originals['_new_table'](settings)
+    if not isinstance(table, BoundedQ):
+        table = CountingQ(table)
+    _tables.append(table)
+    return table
+
+
+def _on_episode(Q, moves):
+    _episodes['games'] += 1
+    _episodes['moves'] += moves
+    _episodes['last'] = moves
+    _episodes['longest'] = max(_episodes['longest'], moves)
+    if _interval is not None and perf_counter() - _last_emit >= _interval:
+        emit()
+
+
+def enable(interval=10.0, output=None):
+    """Starts counting; snapshots go out every interval seconds of training.
+
+    output is a file name to append JSON lines to, a function to call with
+    each snapshot, or None for standard error. An interval of None only
+    collects, see snapshot.
+    """
+    global _output, _interval, _last_emit
+    if _originals:
+        disable()
+    reset()
+    for owner, name in TARGETS:
+        function = getattr(owner, name)
+        _originals[owner, name] = function
+        label = name if owner is not State else 'State.' + name
+        if owner is player:
+            label = 'player.' + name
+        setattr(owner, name, _timed(label, function))
+    _originals['_new_table'] = q_learning._new_table
+    q_learning._new_table = _counting_table
+    q_learning._episode_hook = _on_episode
+    _output = output
+    _interval = interval
+    _last_emit = perf_counter()
+
+
+def disable():
+    """Stops counting and restores the original functions."""
+    q_learning._episode_hook = None
+    if '_new_table' in _originals:
+        q_learning._new_table = _originals.pop('_new_table')
+    for (owner, name), function in _originals.items():
+        setattr(owner, name, function)
+    _originals.clear()
+
+
+def enabled():
+    """Returns true while the instrumentation is on."""
+    return bool(_originals)
+
+
+def reset():
+    """Zeroes every counter."""
+    _calls.clear()
+    _tables.clear()
+    for key in _episodes:
+        _episodes[key] = 0
+
+
+def snapshot():
+    """Returns the current counters as a dict that can be dumped as JSON."""
+    calls = {}
+    for name, (count, seconds) in sorted(_calls.items(),
+                                         key=lambda item: -item[1][1]):
+        calls[name] = {'calls': count, 'seconds': seconds,
+                       'us_per_call': 1e6 * seconds / count if count else 0.0}
+    table = _tables[-1] if _tables else None
+    lookups = table.hits + table.misses if table is not None else 0
+    games = _episodes['games']
+    return {
+        'time': time(),
+        'pid': getpid(),
+        'calls': calls,
+        'q_table': {
+            'size': len(table) if table is not None else None,
+            'hits': table.hits if table is not None else 0,
+            'misses': table.misses if table is not None else 0,
+            'hit_rate': table.hits / lookups if lookups else 0.0
+        },
+        'episodes': {
+            'games': games,
+            'moves': _episodes['moves'],
+            'mean_length': _episodes['moves'] / games if games else 0.0,
+            'last_length': _episodes['last'],
+            'longest': _episodes['longest']
+        }
+    }
+
+
+def emit():
+    """Sends a snapshot to the output given to enable."""
+    global _last_emit
+    _last_emit = perf_counter()
+    stats = snapshot()
+    if callable(_output):
+        _output(stats)
+    elif _output is None:
+        print(json.dumps(stats), file=sys.stderr)
+    else:
+        with open(_output, 'a') as file:
+            file.write(json.dumps(stats) + '\n')
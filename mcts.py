@@ -0,0 +1,297 @@
+'''
+mcts.py
+
+A Monte Carlo tree search player for a checkers game. Children are picked by
+UCT and leaves are valued by the q table when it knows the position or by a
+random playout on the bitboard engine otherwise. The tree under the position
+that comes up next is kept between moves.
+
+With workers > 1 the search spreads over processes in one of two ways. By
+default batches of leaves, picked with virtual visits, are valued in a pool
+of processes while the tree stays here. With root_parallel every worker
+grows its own tree from the root and the visit counts of the root moves are
+summed to pick the move.
+'''
+
+from math import log, sqrt
+from multiprocessing import Pipe, Pool, Process
+from random import choice, getrandbits, seed
+from time import perf_counter
+
+from bitboard import BitboardState
+from q_table import state_value
+from state import Player
+
+WIN_VALUE = 100
+# playouts still going after this many moves are scored by material
+ROLLOUT_MOVES = 150
+# leaves valued per pool call for each worker in leaf parallel search
+LEAF_BATCH = 8
+
+_Q_VALUES = None
+
+
+class Node:
+    """A position in the search tree.
+
+    total is the sum of the values backed up through the node, from red's
+    point of view between -1 and 1; visits also counts playouts in flight.
+    """
+    __slots__ = ('state', 'move_info', 'parent', 'children', 'untried',
+                 'visits', 'total')
+
+    def __init__(self, state, move_info=None, parent=None):
+        self.state = state
+        self.move_info = move_info
+        self.parent = parent
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.total = 0.0
+
+
+def rollout(state):
+    """Plays random moves from state, returns 1 if red wins, -1 if black.
+
+    Unfinished playouts are worth the material balance, between -1 and 1.
+    """
+    bitboard = BitboardState.from_state(state)
+    for _ in range(ROLLOUT_MOVES):
+        paths = bitboard.generate_paths()
+        if not paths:
+            # the player to move has lost
+            return -1 if bitboard.whose_move == Player.RED else 1
+        bitboard = bitboard.apply(*choice(paths))
+    kings = bitboard.kings
+    red = bin(bitboard.red).count('1') + bin(bitboard.red & kings).count('1')
+    black = bin(bitboard.black).count('1') + \
+        bin(bitboard.black & kings).count('1')
+    return (red - black) / (red + black)
+
+
+def evaluate(state, Q_VALUES=None):
+    """Value of a leaf from red's point of view, between -1 and 1.
+
+    Q_VALUES is a q table or a model such as approx_q.LinearQ, see
+    q_table.state_value.
+    """
+    winner = state.is_game_over()
+    if winner:
+        return 1 if winner == Player.RED else -1
+    if Q_VALUES:
+        value = state_value(Q_VALUES, state)
+        if value is not None:
+            return max(-1.0, min(1.0, value / WIN_VALUE))
+    return rollout(state)
+
+
+def _init_leaf_worker(Q_VALUES):
+    global _Q_VALUES
+    _Q_VALUES = Q_VALUES
+    # forked workers would otherwise all play the same playouts
+    seed()
+
+
+def _evaluate_leaf(state):
+    return evaluate(state, _Q_VALUES)
+
+
+def _root_worker(connection, Q_VALUES, exploration, worker_seed):
+    """Grows its own tree for root parallel search.
+
+    Each task is (state, time_limit, simulations) and is answered with the
+    root statistics of the search, see MCTSPlayer.root_stats.
+    """
+    seed(worker_seed)
+    player = MCTSPlayer(Q_VALUES, exploration=exploration)
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        state, player.time_limit, player.simulations = task
+        player.search(state)
+        connection.send(player.root_stats())
+    connection.close()
+
+
+class MCTSPlayer:
+    """Picks moves by Monte Carlo tree search within a per move budget.
+
+    The budget is time_limit seconds, simulations playouts, or whichever
+    runs out first. Values are from red's point of view like the q values.
+    The tree is kept between moves, so reuse one player for a whole game,
+    and close it, or use it in a with block, when workers > 1.
+    """
+    def __init__(self, Q_VALUES=None, time_limit=0.5, simulations=None,
+                 workers=1, root_parallel=False, exploration=1.4):
+        if time_limit is None and simulations is None:
+            raise ValueError('MCTSPlayer needs a time_limit or simulations')
+        self.Q_VALUES = Q_VALUES if Q_VALUES is not None else {}
+        self.time_limit = time_limit
+        self.simulations = simulations
+        self.workers = workers
+        self.root_parallel = root_parallel
+        self.exploration = exploration
+        self.root = None
+        self.playouts = 0
+        self._pool = None
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def move(self, maximize, state):
+        """Searches from state; returns ((new_state, move_info), value).
+
+        The most visited move is played, maximize only has to agree with
+        state.whose_move.
+        """
+        moves = state.legal_moves()
+        if len(moves) == 1:
+            # nothing to choose, keep the time for the next move
+            root = self._root_for(state)
+            value = WIN_VALUE * root.total / root.visits if root.visits else 0
+            return (state.move(moves[0]), moves[0]), value
+        if self.workers > 1 and self.root_parallel:
+            stats = self._search_workers(state)
+        else:
+            stats = self.search(state).root_stats()
+        if not stats:
+            return (state.move(moves[0]), moves[0]), 0
+        steps, (visits, total) = max(stats.items(),
+                                     key=lambda item: item[1][0])
+        move_info = next(m for m in moves if tuple(m.steps) == steps)
+        return (state.move(move_info), move_info), \
+            WIN_VALUE * total / visits
+
+    def search(self, state):
+        """Runs playouts from state within the budget and returns self."""
+        root = self._root_for(state)
+        batch = LEAF_BATCH * self.workers if self.workers > 1 else 1
+        if batch > 1 and self._pool is None:
+            self._pool = Pool(self.workers, _init_leaf_worker,
+                              (self.Q_VALUES,))
+        deadline = None
+        if self.time_limit is not None:
+            deadline = perf_counter() + self.time_limit
+        self.playouts = 0
+        while (self.simulations is None or
+               self.playouts < self.simulations) and \
+                (deadline is None or perf_counter() < deadline):
+            n = batch if self.simulations is None else \
+                min(batch, self.simulations - self.playouts)
+            leaves = [self._select(root) for _ in range(n)]
+            if batch > 1:
+                values = self._pool.map(_evaluate_leaf,
+                                        [leaf.state for leaf in leaves],
+                                        chunksize=LEAF_BATCH)
+            else:
+                values = [evaluate(leaf.state, self.Q_VALUES)
+                          for leaf in leaves]
+            for leaf, value in zip(leaves, values):
+                node = leaf
+                while node is not None:
+                    node.total += value
+                    node = node.parent
+            self.playouts += n
+        return self
+
+    def root_stats(self):
+        """Returns {move steps: (visits, total)} of the moves of the root."""
+        if self.root is None:
+            return {}
+        return {tuple(child.move_info.steps): (child.visits, child.total)
+                for child in self.root.children}
+
+    def close(self):
+        """Stops the worker processes."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        for connection in self._connections:
+            connection.send(None)
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def _root_for(self, state):
+        """Returns the node of state, reusing the last tree when it has it.
+
+        The position after our move and the reply is two moves below the
+        root that was searched last.
+        """
+        frontier = [self.root] if self.root is not None else []
+        for _ in range(3):
+            for node in frontier:
+                if node.state.zobrist == state.zobrist and \
+                        node.state.board == state.board:
+                    node.parent = None
+                    self.root = node
+                    return node
+            frontier = [child for node in frontier for child in node.children]
+        self.root = Node(state)
+        return self.root
+
+    def _select(self, root):
+        """Walks down by UCT to a new leaf, adding a visit to its path."""
+        node = root
+        node.visits += 1
+        while True:
+            if node.untried is None:
+                node.untried = node.state.generate_successors()
+                node.untried.reverse()
+            if node.untried:
+                new_state, move_info = node.untried.pop()
+                child = Node(new_state, move_info, node)
+                node.children.append(child)
+                child.visits += 1
+                return child
+            if not node.children:
+                # the game is over here
+                return node
+            node = self._best_child(node)
+            node.visits += 1
+
+    def _best_child(self, node):
+        sign = 1 if node.state.whose_move == Player.RED else -1
+        scale = self.exploration * sqrt(log(node.visits))
+        return max(node.children, key=lambda child: sign * child.total /
+                   child.visits + scale / sqrt(child.visits))
+
+    def _search_workers(self, state):
+        """Root parallel search, returns the summed root statistics."""
+        if not self._processes:
+            for i in range(self.workers):
+                parent, child = Pipe()
+                process = Process(target=_root_worker,
+                                  args=(child, self.Q_VALUES,
+                                        self.exploration, getrandbits(64)),
+                                  daemon=True)
+                process.start()
+                child.close()
+                self._connections.append(parent)
+                self._processes.append(process)
+        simulations = None
+        if self.simulations is not None:
+            simulations = max(1, self.simulations // self.workers)
+        for connection in self._connections:
+            connection.send((state, self.time_limit, simulations))
+        stats = {}
+        for connection in self._connections:
+            for steps, (visits, total) in connection.recv().items():
+                merged = stats.get(steps, (0, 0.0))
+                stats[steps] = (merged[0] + visits, merged[1] + total)
+        self.playouts = sum(visits for visits, _ in stats.values())
+        return stats
+
+
+def move(maximize, state, Q_VALUES, time_limit=0.5, simulations=None):
+    """Make a move by tree search, like search.move."""
+    return MCTSPlayer(Q_VALUES, time_limit, simulations).move(maximize, state)
@@ -0,0 +1,104 @@
+'''
+opening_book.py
+
+A book of opening moves for each board size. Every position reachable in the
+first BOOK_PLIES moves of a game is searched once with the alpha-beta player
+and its best move is saved to a small file, so the first moves of a game are
+a table lookup instead of a search.
+'''
+
+import json
+from os import makedirs, replace
+from os.path import dirname, isfile, join
+
+from game_log import encode_move
+from search import AlphaBetaPlayer
+from state import Player, State
+
+BOOK_DIR = 'cache'
+BOOK_PLIES = 4
+# search budget per book position, a node budget keeps the book reproducible
+BOOK_NODES = 500
+
+_books = {}
+
+
+class OpeningBook:
+    """Book moves of opening positions, keyed by State.generate_hash.
+
+    Moves are stored as game_log.encode_move square lists together with the
+    searched value, from red's point of view.
+    """
+    def __init__(self, board_size, entries=None):
+        self.board_size = board_size
+        self.entries = entries if entries is not None else {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, state):
+        """Returns (move_info, value) of the book move of state, or None."""
+        if state.board_size != self.board_size:
+            return None
+        entry = self.entries.get(state.generate_hash())
+        if entry is None:
+            return None
+        move, value = entry
+        for move_info in state.legal_moves():
+            if encode_move(move_info, self.board_size) == move:
+                return move_info, value
+        return None
+
+    def save(self, file_location):
+        """Writes the book as JSON, replacing any older file at once."""
+        if dirname(file_location):
+            makedirs(dirname(file_location), exist_ok=True)
+        with open(file_location + '.tmp', 'w') as file:
+            json.dump({'board_size': self.board_size,
+                       'entries': {str(key): entry for key, entry
+                                   in self.entries.items()}},
+                      file, separators=(',', ':'))
+        replace(file_location + '.tmp', file_location)
+
+    @classmethod
+    def load(cls, file_location):
+        """Reads a book written by save."""
+        with open(file_location) as file:
+            data = json.load(file)
+        return cls(data['board_size'],
+                   {int(key): tuple(entry)
+                    for key, entry in data['entries'].items()})
+
+
+def build_book(board_size, plies=BOOK_PLIES, node_limit=BOOK_NODES):
+    """Searches every position of the first plies moves of a game."""
+    book = OpeningBook(board_size)
+    searcher = AlphaBetaPlayer(time_limit=None, node_limit=node_limit)
+    frontier = [State(board_size=board_size)]
+    for _ in range(plies):
+        next_frontier = []
+        for state in frontier:
+            key = state.generate_hash()
+            if key in book.entries or state.is_game_over():
+                continue
+            (_, move_info), value = searcher.move(
+                state.whose_move == Player.RED, state)
+            book.entries[key] = (encode_move(move_info, board_size), value)
+            next_frontier += [state.move(m) for m in state.legal_moves()]
+        frontier = next_frontier
+    return book
+
+
+def opening_book(board_size, file_location=None):
+    """Returns the book of a board size, built and saved on first use."""
+    if file_location is None:
+        file_location = join(BOOK_DIR, 'book-%d.json' % board_size)
+    book = _books.get(file_location)
+    if book is None:
+        if isfile(file_location):
+            book = OpeningBook.load(file_location)
+        else:
+            book = build_book(board_size)
+            book.save(file_location)
+        _books[file_location] = book
+    return book
@@ -5,32 +5,73 @@ A player for a checkers game. Uses a precomputed table of values assigned to
 specific board states to determine the best move.
 '''
 
-from q_learning import *
-from state import *
 from random import randint
 
+from q_table import q_key
+from state import Player
+
+
+def move(maximize, state, Q_VALUES, book=None, tablebase=None):
+    """Make a move from the q learning values.
+
+    With an opening_book.OpeningBook, positions in the book are played from
+    it without looking at the successors. With a tablebase.Tablebase,
+    positions it covers are played perfectly from their exact values.
+    Q_VALUES can also be a model with a successor_values method, such as
+    approx_q.LinearQ, that values every move at once.
+    """
+    if tablebase is not None and tablebase.probe(state) is not None:
+        # exact values are from red's point of view, whoever calls
+        red = state.whose_move == Player.RED
+        best = None
+        for new_state, move_info in state.generate_successors():
+            value = tablebase.value(new_state)
+            if best is None or (value > best[1] if red
+                                else value < best[1]):
+                best = (new_state, move_info), value
+        return best
+
+    if book is not None:
+        entry = book.lookup(state)
+        if entry is not None:
+            move_info, value = entry
+            new_state = state.move(move_info)
+            if hasattr(Q_VALUES, 'successor_values'):
+                return (new_state, move_info), value
+            hash, sign = q_key(Q_VALUES, new_state)
+            known = Q_VALUES.get(hash)
+            return (new_state, move_info), \
+                sign * known[0] if known is not None else value
+
+    if hasattr(Q_VALUES, 'successor_values'):
+        moves, values = Q_VALUES.successor_values(state)
+        best = (max if maximize else min)(range(len(moves)),
+                                          key=values.__getitem__)
+        return (state.move(moves[best]), moves[best]), values[best]
 
-def move(maximize, state, Q_VALUES):
-    """Make a move from the q learning values."""
-    successors = state.generate_successors()
     best_value = float('-inf') if maximize else float('inf')
     best_move = None
-    for (new_state, move_info) in successors:
-        hash = new_state.generate_hash()
+    moves = state.legal_moves()
+    for move_info in moves:
+        undo = state.make_move(move_info)
+        hash, sign = q_key(Q_VALUES, state)
+        state.unmake_move(undo)
         try:
-            q_value, _ = Q_VALUES[hash]
+            q_value = sign * Q_VALUES[hash][0]
             if maximize:
                 if q_value > best_value:
                     best_value = q_value
-                    best_move = (new_state, move_info)
+                    best_move = move_info
             else:
                 if q_value < best_value:
                     best_value = q_value
-                    best_move = (new_state, move_info)
+                    best_move = move_info
         except KeyError:
             pass
 
     if best_move is None:
-        move = successors[randint(0, len(successors) - 1)]
-        return move, Q_VALUES.get(move[0].generate_hash()) or 0
-    return best_move, best_value
+        move_info = moves[randint(0, len(moves) - 1)]
+        new_state = state.move(move_info)
+        return (new_state, move_info), \
+            Q_VALUES.get(q_key(Q_VALUES, new_state)[0]) or 0
+    return (state.move(best_move), best_move), best_value
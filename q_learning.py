@@ -4,16 +4,70 @@ q_learning.py
 A q_learning function for a checkers game.
 '''
 
+import json
 import pickle
+from glob import escape, glob
+from hashlib import sha1
 from io import FileIO
-from os.path import isfile, dirname
-from os import makedirs
-from random import randint, uniform
+from os.path import isfile, dirname, join
+from os import fsync, makedirs, remove, replace
+from math import isqrt
+from random import Random, getstate, randint, seed, setstate, uniform
+from time import perf_counter
 
-from state import Player, State
+from game_log import GameWriter, is_compressed
+from opening_book import opening_book
+from q_table import (BoundedQ, CanonicalQ, MappedQ, is_table_file, q_key,
+                     save_table)
+from state import GameHistory, Piece, Player, State, zobrist_hash
+from tablebase import tablebase
 
 Q_VALUES = {}
 
+CACHE_DIR = 'cache'
+# bump when a change to training makes tables from older versions differ
+TRAINING_VERSION = 3
+# optional settings and their defaults, see q_learning
+DEFAULT_SETTINGS = {
+    'WORKERS': 1,
+    'MERGE_GAMES': 10,
+    'SEED': None,
+    'SYMMETRY': False,
+    'Q_MEMORY': None,
+    'CHECKPOINT_GAMES': 1000,
+    'GAME_LOG': None,
+    'OPENING_BOOK': False,
+    'TABLEBASE': None,
+    'APPROXIMATE': False,
+    'BATCH_SIZE': 32
+}
+# called with (Q, moves played) after every training game, see instrument
+_episode_hook = None
+# settings that do not change the table training produces
+_RUN_SETTINGS = ('Q_GAMES', 'CHECKPOINT_GAMES', 'GAME_LOG')
+# settings only the approximate learner reads
+_APPROXIMATE_SETTINGS = ('BATCH_SIZE',)
+# settings the approximate learner does not support
+_TABLE_SETTINGS = ('GAME_LOG', 'OPENING_BOOK', 'TABLEBASE')
+# settings the cache names held before cache_prefix
+_LEGACY_SETTINGS = ('LEARNING_RATE', 'EXPLORE_PROB', 'DISCOUNT', 'SYMMETRY')
+# returned by _update when a game ends without a winner
+DRAW = -1
+# reward for a move into a drawn position
+DRAW_REWARD = 0
+
+
+def parse_value(text):
+    """Reads a setting value: a number, true, false or a string."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
 
 def save_q(Q, file_location):
     """Saves the current q learning values to the specified location."""
@@ -21,121 +75,623 @@ def save_q(Q, file_location):
         makedirs(dirname(file_location))
     except OSError as exc:
         pass
-    file = FileIO(file_location, 'w')
-    pickle.dump(Q, file)
-    file.close()
+    # write next to the target and swap it in, readers never see half a file
+    save_table(Q, file_location + '.tmp')
+    replace(file_location + '.tmp', file_location)
 
 
 def load_q(file_location):
-    """Loads the q learning values from the specified file."""
-    file = FileIO(file_location, 'r')
-    Q = pickle.load(file)
-    file.close()
-    return Q
+    """Loads the q learning values from the specified file.
+
+    Tables are memory mapped and read only, use to_dict to train them further.
+    Pickled tables from older versions, including ones keyed by board strings,
+    are converted and written back in the compact format. Weights of the
+    approximate learner, saved as JSON, load as an approx_q.LinearQ.
+    """
+    if file_location.endswith('.json'):
+        from approx_q import LinearQ
+        return LinearQ.load(file_location)
+    if not is_table_file(file_location):
+        file = FileIO(file_location, 'r')
+        Q = pickle.load(file)
+        file.close()
+        save_q(convert_string_keys(Q), file_location)
+    return MappedQ(file_location)
+
+
+def convert_string_keys(Q):
+    """Rekeys a table that uses the old board string hashes.
+
+    The old hash was the piece value of every square, row by row, followed by
+    the player whose move it is.
+    """
+    converted = CanonicalQ() if getattr(Q, 'canonical', False) else {}
+    for key, value in Q.items():
+        if isinstance(key, str):
+            size = isqrt(len(key) - 1)
+            board = [[Piece(int(key[y * size + x])) for x in range(size)]
+                     for y in range(size)]
+            key = zobrist_hash(board, Player(int(key[-1])), size)
+        converted[key] = value
+    return converted
+
+
+def cache_prefix(settings, board_size):
+    """Returns the cache file prefix of a training configuration.
+
+    The name starts with the main hyperparameters and ends with a digest of
+    every setting that changes the trained table, so a table trained with
+    other settings is never picked up by accident.
+    """
+    keyed = _keyed_settings(settings)
+    keyed['BOARD_SIZE'] = board_size
+    keyed['TRAINING_VERSION'] = TRAINING_VERSION
+    digest = sha1(json.dumps(keyed, sort_keys=True).encode()).hexdigest()
+    return join(CACHE_DIR, '%.1f-%.1f-%.1f-%d-%s' % (
+        settings['LEARNING_RATE'], settings['EXPLORE_PROB'],
+        settings['DISCOUNT'], board_size, digest[:12]))
 
 
-def q_learning(settings, initial_state=State()):
-    """Run q learning on the specified state."""
+def legacy_cache_path(settings, board_size):
+    """Returns the name tables of these settings had before cache_prefix.
+
+    Those names only held the main hyperparameters, the games and the board
+    size, so only settings that leave every other option at its default,
+    apart from SYMMETRY, have one. Returns None for the others.
+    """
+    if any(name not in _LEGACY_SETTINGS for name in _keyed_settings(settings)):
+        return None
+    return join(CACHE_DIR, '%.1f-%.1f-%.1f-%d-%d%s.save' % (
+        settings['LEARNING_RATE'], settings['EXPLORE_PROB'],
+        settings['DISCOUNT'], settings['Q_GAMES'], board_size,
+        '-sym' if settings.get('SYMMETRY') else ''))
+
+
+def _keyed_settings(settings):
+    """The settings that change what training produces."""
+    approximate = settings.get('APPROXIMATE', False)
+    # optional settings left at their default are not part of the key, so
+    # adding a new option keeps the names of existing caches
+    return {name: value for name, value in settings.items()
+            if name not in _RUN_SETTINGS and
+            (approximate or name not in _APPROXIMATE_SETTINGS) and
+            (name not in DEFAULT_SETTINGS or value != DEFAULT_SETTINGS[name])}
+
+
+def cached_tables(prefix):
+    """Returns {games: path} of the finished tables saved under prefix."""
+    tables = {}
+    for path in glob(escape(prefix) + '-*.save'):
+        games = path[len(prefix) + 1:-len('.save')]
+        if games.isdigit():
+            tables[int(games)] = path
+    return tables
+
+
+def q_learning(settings, initial_state=None):
+    """Run q learning on the specified state, by default the start of an
+    8x8 game.
+
+    Training picks up from the furthest saved progress with the same
+    settings: a checkpoint of an interrupted run or a finished table with
+    fewer games. Checkpoints are written every CHECKPOINT_GAMES games. A
+    table cached under its name from before cache_prefix is loaded from
+    there (see legacy_cache_path), it is never resumed from since older
+    versions trained differently. Episodes end in a draw, rewarded
+    DRAW_REWARD, by the rules of state.GameHistory.
+
+    Optional settings: WORKERS plays episodes in that many processes,
+    MERGE_GAMES is the number of games each worker plays between merges of
+    the tables, SEED makes a run reproducible, SYMMETRY stores a position
+    and its flipped twin under one key (see State.canonical_hash) and
+    Q_MEMORY caps the table at about that many bytes (see BoundedQ).
+    GAME_LOG appends every training game to that file (see game_log), a
+    plain text one when WORKERS > 1, and OPENING_BOOK plays the book move
+    instead of the best known one in book positions (see opening_book).
+    TABLEBASE is the file of an endgame table (see tablebase): positions it
+    covers get their exact value and end the game. APPROXIMATE trains a
+    linear function of board features in mini-batches of BATCH_SIZE moves
+    instead of a table (see approx_q); it cannot be combined with GAME_LOG,
+    OPENING_BOOK or TABLEBASE.
+    """
+    settings = dict(DEFAULT_SETTINGS, **settings)
+    if initial_state is None:
+        initial_state = State()
+    if settings['APPROXIMATE']:
+        table_only = [name for name in _TABLE_SETTINGS if settings[name]]
+        if table_only:
+            raise ValueError('APPROXIMATE training does not support %s' %
+                             ', '.join(table_only))
+        # imported here, numpy is only needed for the approximate learner
+        from approx_q import approx_q_learning
+        return approx_q_learning(settings, initial_state)
     # variable settings
-    LEARNING_RATE = settings['LEARNING_RATE']
-    EXPLORE_PROB = settings['EXPLORE_PROB']
-    DISCOUNT = settings['DISCOUNT']
     Q_GAMES = settings['Q_GAMES']
+    WORKERS = settings['WORKERS']
+    SEED = settings['SEED']
+    CHECKPOINT_GAMES = settings['CHECKPOINT_GAMES']
+    if WORKERS > 1 and settings['GAME_LOG'] and \
+            is_compressed(settings['GAME_LOG']):
+        raise ValueError('workers cannot share the gzip log %s, log to a '
+                         'plain text file' % settings['GAME_LOG'])
 
     # check if q-values are cached
-    cache_path = 'cache/%.1f-%.1f-%.1f-%d-%d.save' % (
-        LEARNING_RATE, EXPLORE_PROB, DISCOUNT, Q_GAMES, initial_state.board_size)
+    prefix = cache_prefix(settings, initial_state.board_size)
+    cache_path = '%s-%d.save' % (prefix, Q_GAMES)
+    checkpoint_path = prefix + '.checkpoint'
     if isfile(cache_path):
         return load_q(cache_path)
-    Q = {}
-    Q[initial_state.generate_hash()] = (0, 1)
-    n_games = 0
-    state = initial_state
-    while n_games < Q_GAMES:
-        # Choose least seen state if explore, choose best q-value otherwise
-        if uniform(0.0, 1.0) < EXPLORE_PROB:
-            (new_state, move_info), q_value = _explore_action(Q, state)
-        else:
-            (new_state, move_info), q_value = _best_action(Q, state)
-        reward = _reward(new_state, move_info)
-
-        game_over = new_state.is_game_over()
-        hash = state.generate_hash()
-        q, n = Q[hash]
-        if game_over == 0:
-            state = new_state
-            _, q_prime = _best_action(Q, new_state)
-            Q[hash] = (q + LEARNING_RATE *
-                       ((reward + DISCOUNT * q_prime) - q_value), n + 1)
-        else:
-            # check if game is over start a new one
-            state = initial_state
-            Q[hash] = (q + LEARNING_RATE * (reward - q_value), n + 1)
-            n_games += 1
+    legacy_path = legacy_cache_path(settings, initial_state.board_size)
+    if legacy_path is not None and isfile(legacy_path):
+        # a table saved under its old name is converted in place when it is
+        # a pickle, but keeps that name: it was trained by an older version
+        return load_q(legacy_path)
+    Q = _new_table(settings)
+    games, random_state = _resume(Q, prefix, Q_GAMES)
+    if settings['OPENING_BOOK']:
+        # build the book once here rather than in every worker
+        opening_book(initial_state.board_size)
+    if settings['TABLEBASE']:
+        # a missing file fails here rather than in every worker
+        tablebase(initial_state.board_size,
+                  file_location=settings['TABLEBASE'])
+    if games == 0:
+        Q[q_key(Q, initial_state)[0]] = (0, 1)
+    # a run continued from a finished table gets its own seed
+    run_seed = SEED if SEED is None or games == 0 else SEED * 1000003 + games
+
+    if WORKERS > 1:
+        rng = Random(run_seed)
+        if random_state is not None:
+            rng.setstate(random_state)
+
+        def checkpoint(played):
+            if played < Q_GAMES - games:
+                _save_checkpoint(checkpoint_path, Q, games + played,
+                                 rng.getstate())
+
+        _parallel_games(Q, settings, initial_state, Q_GAMES - games, WORKERS,
+                        settings['MERGE_GAMES'], rng, checkpoint,
+                        CHECKPOINT_GAMES)
+    else:
+        if random_state is not None:
+            setstate(random_state)
+        elif run_seed is not None:
+            seed(run_seed)
+        while games < Q_GAMES:
+            n_games = min(CHECKPOINT_GAMES, Q_GAMES - games)
+            _play_games(Q, settings, initial_state, n_games)
+            games += n_games
+            if games < Q_GAMES:
+                _save_checkpoint(checkpoint_path, Q, games, getstate())
 
     save_q(Q, cache_path)
+    _write_settings(prefix + '.json', settings, initial_state.board_size)
+    if isfile(checkpoint_path) and \
+            _load_checkpoint(checkpoint_path)[0]['games'] <= Q_GAMES:
+        remove(checkpoint_path)
     return Q
 
 
+def _new_table(settings):
+    """Returns an empty q table of the kind the settings ask for."""
+    if settings['Q_MEMORY'] is not None:
+        return BoundedQ(max_bytes=settings['Q_MEMORY'],
+                        canonical=settings['SYMMETRY'])
+    return CanonicalQ() if settings['SYMMETRY'] else {}
+
+
+def _resume(Q, prefix, n_games):
+    """Fills Q with the furthest saved progress of up to n_games games.
+
+    Returns the number of games already played and, when resuming from a
+    checkpoint, the random state to continue with.
+    """
+    tables = [games for games in cached_tables(prefix) if games <= n_games]
+    table_games = max(tables, default=0)
+    checkpoint_path = prefix + '.checkpoint'
+    if isfile(checkpoint_path):
+        meta, table = _load_checkpoint(checkpoint_path)
+        if table_games <= meta['games'] <= n_games:
+            Q.update(table)
+            return meta['games'], meta['random_state']
+    if table_games:
+        table = load_q('%s-%d.save' % (prefix, table_games))
+        Q.update(table.to_dict())
+        table.close()
+    return table_games, None
+
+
+def _save_checkpoint(file_location, Q, games, random_state):
+    """Atomically saves training progress."""
+    try:
+        makedirs(dirname(file_location))
+    except OSError as exc:
+        pass
+    meta = {'games': games, 'random_state': random_state}
+    with open(file_location + '.tmp', 'wb') as file:
+        pickle.dump((meta, dict(Q.items())), file)
+        file.flush()
+        fsync(file.fileno())
+    replace(file_location + '.tmp', file_location)
+
+
+def _load_checkpoint(file_location):
+    """Returns the (meta, table) saved by _save_checkpoint."""
+    with open(file_location, 'rb') as file:
+        return pickle.load(file)
+
+
+def _write_settings(file_location, settings, board_size):
+    """Records the settings a cache prefix stands for."""
+    if not isfile(file_location):
+        with open(file_location, 'w') as file:
+            json.dump(dict(settings, BOARD_SIZE=board_size), file,
+                      sort_keys=True, indent=2)
+
+
+def _play_games(Q, settings, initial_state, n_games):
+    """Plays n_games episodes of self play, updating Q."""
+    EXPLORE_PROB = settings['EXPLORE_PROB']
+    log = settings.get('GAME_LOG')
+    writer = GameWriter(log) if log else None
+    book = opening_book(initial_state.board_size) \
+        if settings.get('OPENING_BOOK') else None
+    endgames = tablebase(initial_state.board_size,
+                         file_location=settings['TABLEBASE']) \
+        if settings.get('TABLEBASE') else None
+
+    games_played = 0
+    state = initial_state
+    history = GameHistory(initial_state)
+    moves, q_values = [], []
+    episode_length = 0
+    try:
+        while games_played < n_games:
+            # Choose least seen state if explore, choose best q-value otherwise
+            if uniform(0.0, 1.0) < EXPLORE_PROB:
+                (new_state, move_info), q_value = _explore_action(Q, state)
+            else:
+                entry = book.lookup(state) if book is not None else None
+                if entry is not None:
+                    (new_state, move_info), q_value = _book_action(
+                        Q, state, entry[0])
+                else:
+                    (new_state, move_info), q_value = _best_action(
+                        Q, state, tablebase=endgames)
+            drawn = history.push(state, move_info, new_state)
+            game_over = _update(Q, settings, state, new_state, move_info,
+                                q_value, endgames, drawn)
+            if writer is not None:
+                moves.append(move_info)
+                q_values.append(q_value)
+            episode_length += 1
+            if game_over == 0:
+                state = new_state
+            else:
+                # check if game is over start a new one
+                if writer is not None:
+                    writer.write(initial_state, moves, q_values,
+                                 max(game_over, 0))
+                    moves, q_values = [], []
+                if _episode_hook is not None:
+                    _episode_hook(Q, episode_length)
+                episode_length = 0
+                state = initial_state
+                history = GameHistory(initial_state)
+                games_played += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _update(Q, settings, state, new_state, move_info, q_value,
+            tablebase=None, drawn=False):
+    """Updates Q for playing move_info, valued q_value, from state.
+
+    drawn is true when new_state is a draw by the rules of GameHistory.
+    Returns the winner of new_state, DRAW for a drawn game or a drawn
+    position of the tablebase, or 0 if the game goes on.
+    """
+    LEARNING_RATE = settings['LEARNING_RATE']
+    DISCOUNT = settings['DISCOUNT']
+
+    # only states that are actually played get an entry
+    new_hash, new_sign = q_key(Q, new_state)
+    if new_hash not in Q:
+        Q[new_hash] = (new_sign * q_value, 1)
+
+    game_over = new_state.is_game_over()
+    if game_over == 0 and drawn:
+        game_over = DRAW
+    reward = DRAW_REWARD if game_over == DRAW else \
+        _reward(new_state, move_info, tablebase)
+    if game_over == 0 and tablebase is not None:
+        # a solved position ends the game, its value is the reward
+        game_over = tablebase.winner(new_state)
+        if game_over is None:
+            game_over = 0
+        elif game_over == 0:
+            game_over = DRAW
+    hash, sign = q_key(Q, state)
+    # a bounded table may have evicted the state since it was played
+    q, n = Q.get(hash, (0.0, 1))
+    q *= sign
+    if game_over == 0:
+        _, q_prime = _best_action(Q, new_state, build_state=False,
+                                  tablebase=tablebase)
+        Q[hash] = (sign * (q + LEARNING_RATE *
+                           ((reward + DISCOUNT * q_prime) - q_value)), n + 1)
+    else:
+        Q[hash] = (sign * (q + LEARNING_RATE * (reward - q_value)), n + 1)
+    return game_over
+
+
+def replay_training(Q, settings, transitions):
+    """Runs the q learning update over recorded moves and returns Q.
+
+    transitions yields (state, move_info, new_state, q_value), e.g. from
+    game_log.replay, and is consumed one move at a time. A TABLEBASE setting
+    values solved positions as training does. The logged q_value is only
+    used for positions Q does not know yet, the update reads the current
+    value of new_state like it does in training.
+    """
+    endgames = None
+    last_state = None
+    for state, move_info, new_state, q_value in transitions:
+        if settings.get('TABLEBASE') and endgames is None:
+            endgames = tablebase(state.board_size,
+                                 file_location=settings['TABLEBASE'])
+        # a game goes on from the state the last move ended in
+        if state is not last_state:
+            history = GameHistory(state)
+        last_state = new_state
+        drawn = history.push(state, move_info, new_state)
+        hash, sign = q_key(Q, new_state)
+        entry = Q.get(hash)
+        if entry is not None:
+            q_value = sign * entry[0]
+        _update(Q, settings, state, new_state, move_info, q_value, endgames,
+                drawn)
+    return Q
+
+
+class _TrackingDict(dict):
+    """A q table that remembers which states were written to."""
+    def __init__(self, Q):
+        super().__init__(Q.items())
+        self.canonical = getattr(Q, 'canonical', False)
+        self.touched = set()
+
+    def __setitem__(self, key, value):
+        self.touched.add(key)
+        super().__setitem__(key, value)
+
+    def merge(self, updates):
+        """Writes entries from the other workers without tracking them."""
+        dict.update(self, updates)
+
+
+class _TrackingBoundedQ(BoundedQ):
+    """A _TrackingDict with the memory budget of the BoundedQ it copies."""
+    def __init__(self, Q):
+        super().__init__(capacity=Q.capacity, canonical=Q.canonical)
+        for key, value in Q.items():
+            BoundedQ.__setitem__(self, key, value)
+        self.touched = set()
+
+    def __setitem__(self, key, value):
+        self.touched.add(key)
+        super().__setitem__(key, value)
+
+    def merge(self, updates):
+        """Writes entries from the other workers without tracking them."""
+        for key, value in updates.items():
+            BoundedQ.__setitem__(self, key, value)
+
+
+def _train_worker(connection, Q, settings, initial_state):
+    """Plays batches of games in a worker process for _parallel_games.
+
+    Each batch starts by applying the merged updates from the last round and
+    returns the entries this worker wrote during the batch, with the length
+    of every game it played for the parent's _episode_hook. The copy of a
+    BoundedQ is bounded like the table it copies.
+    """
+    global _episode_hook
+    if isinstance(Q, BoundedQ):
+        Q = _TrackingBoundedQ(Q)
+    else:
+        Q = _TrackingDict(Q)
+    lengths = []
+
+    def count_game(Q, moves):
+        lengths.append(moves)
+    _episode_hook = count_game
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        updates, n_games, worker_seed = task
+        Q.merge(updates)
+        Q.touched = set()
+        seed(worker_seed)
+        _play_games(Q, settings, initial_state, n_games)
+        # entries written and then evicted again are not sent
+        connection.send(({key: Q[key] for key in Q.touched if key in Q},
+                         lengths))
+        lengths.clear()
+    connection.close()
+
+
+def _parallel_games(Q, settings, initial_state, n_games, workers, merge_games,
+                    rng, checkpoint=None, checkpoint_games=None):
+    """Plays n_games episodes spread over worker processes, updating Q.
+
+    Every round each worker plays up to merge_games games on its own copy of
+    the table, then the copies are merged into Q and the merged entries are
+    sent back to all workers. Worker seeds are drawn from rng. checkpoint is
+    called with the games played so far about every checkpoint_games games.
+    """
+    # imported here, serial training and playing do not need it
+    from multiprocessing import Pipe, Process
+
+    connections = []
+    processes = []
+    for _ in range(workers):
+        parent, child = Pipe()
+        process = Process(target=_train_worker,
+                          args=(child, Q, settings, initial_state),
+                          daemon=True)
+        process.start()
+        child.close()
+        connections.append(parent)
+        processes.append(process)
+
+    updates = {}
+    remaining = n_games
+    try:
+        while remaining > 0:
+            batch = min(remaining, workers * merge_games)
+            for i, connection in enumerate(connections):
+                games = batch // workers + (1 if i < batch % workers else 0)
+                connection.send((updates, games, rng.getrandbits(64)))
+            results = [c.recv() for c in connections]
+            updates = merge_q(Q, [entries for entries, _ in results])
+            Q.update(updates)
+            if _episode_hook is not None:
+                for _, lengths in results:
+                    for moves in lengths:
+                        _episode_hook(Q, moves)
+            remaining -= batch
+            played = n_games - remaining
+            if checkpoint is not None and played // checkpoint_games > \
+                    (played - batch) // checkpoint_games:
+                checkpoint(played)
+    finally:
+        for connection in connections:
+            connection.send(None)
+            connection.close()
+        for process in processes:
+            process.join()
+
+
+def merge_q(Q, deltas):
+    """Merges tables trained from Q into new entries weighted by visits.
+
+    Each delta maps states to the (q, n) a worker ended with. A worker's q is
+    weighted by the visits it added on top of the n already in Q; the visit
+    counts are summed.
+    """
+    entries = {}
+    for delta in deltas:
+        for hash, entry in delta.items():
+            entries.setdefault(hash, []).append(entry)
+    updates = {}
+    for hash, values in entries.items():
+        base_n = Q[hash][1] if hash in Q else 0
+        added = [(q, n - base_n) for q, n in values if n > base_n]
+        if added:
+            visits = sum(a for _, a in added)
+            updates[hash] = (sum(q * a for q, a in added) / visits,
+                             base_n + visits)
+        else:
+            # written without a new visit, e.g. a freshly seen successor
+            updates[hash] = (sum(q for q, _ in values) / len(values),
+                             max(n for _, n in values))
+    return updates
+
+
 def _explore_action(Q, state):
     """Explores going from the passed state."""
-    # explore, use the least seen state
+    # explore, use the least seen state, unseen states count as seen once
     explore_actions = []
     min_visited = float('inf')
-    for (new_state, move_info) in state.generate_successors():
-        hash = new_state.generate_hash()
+    for move_info in state.legal_moves():
+        undo = state.make_move(move_info)
+        hash, sign = q_key(Q, state)
+        state.unmake_move(undo)
         try:
-            _, n = Q[hash]
+            q_value, n = Q[hash]
+            q_value *= sign
         except KeyError:
-            n = 1
-            Q[hash] = (uniform(-.1, .1), 1)
+            q_value, n = uniform(-.1, .1), 1
         if n < min_visited:
-            explore_actions = [(new_state, move_info)]
+            explore_actions = [(move_info, q_value)]
             min_visited = n
         elif n == min_visited:
-            explore_actions.append((new_state, move_info))
+            explore_actions.append((move_info, q_value))
     if len(explore_actions) == 1:
-        return explore_actions[0], Q[explore_actions[0][0].generate_hash()][0]
-    s, move_info = explore_actions[randint(0, len(explore_actions) - 1)]
-    return (s, move_info), Q[s.generate_hash()][0]
+        move_info, q_value = explore_actions[0]
+    else:
+        move_info, q_value = explore_actions[
+            randint(0, len(explore_actions) - 1)]
+    return (state.move(move_info), move_info), q_value
+
+
+def _book_action(Q, state, move_info):
+    """Plays an opening book move, valued like _best_action values moves."""
+    new_state = state.move(move_info)
+    hash, sign = q_key(Q, new_state)
+    try:
+        q_value = sign * Q[hash][0]
+    except KeyError:
+        q_value = uniform(-0.1, .1)
+    return (new_state, move_info), q_value
+
 
+def _best_action(Q, state, build_state=True, tablebase=None):
+    """Follows the best known course of action from the passed state.
 
-def _best_action(Q, state):
-    """Follows the best known course of action from the passed state."""
-    successors = state.generate_successors()
+    Successors missing from Q get a small random value but no entry. With
+    build_state False only the best q value is needed and no successor state
+    is created. Successors in the tablebase get their exact value instead.
+    """
     player = state.whose_move
     best_q_value = float('inf') if player == player.BLACK else float('-inf')
     best_actions = []
-    for (new_state, move_info) in successors:
-        hash = new_state.generate_hash()
-        try:
-            q_value, _ = Q[hash]
-        except KeyError:
-            q_value = uniform(-0.1, .1)
-            Q[hash] = (q_value, 1)
+    # successors are looked up once enough pieces are taken to be covered
+    min_kills = float('inf')
+    if tablebase is not None:
+        counts = state.piece_counts()
+        min_kills = sum(counts) - counts[Piece.EMPTY] - tablebase.max_pieces
+    for move_info in state.legal_moves():
+        undo = state.make_move(move_info)
+        exact = tablebase.value(state) \
+            if len(move_info.kills) >= min_kills else None
+        hash, sign = q_key(Q, state)
+        state.unmake_move(undo)
+        if exact is not None:
+            q_value = exact
+        else:
+            try:
+                q_value, _ = Q[hash]
+                q_value *= sign
+            except KeyError:
+                q_value = uniform(-0.1, .1)
 
         if player == player.BLACK:
             if q_value < best_q_value:
                 best_q_value = q_value
-                best_actions = [(new_state, move_info)]
+                best_actions = [move_info]
             elif q_value == best_q_value:
-                best_actions.append((new_state, move_info))
+                best_actions.append(move_info)
         else:
             if q_value > best_q_value:
                 best_q_value = q_value
-                best_actions = [(new_state, move_info)]
+                best_actions = [move_info]
             elif q_value == best_q_value:
-                best_actions.append((new_state, move_info))
+                best_actions.append(move_info)
     if len(best_actions) == 1:
-        return best_actions[0], best_q_value
-    try:
-        return best_actions[randint(0, len(best_actions) - 1)], best_q_value
-    except ValueError as e:
-        print(state)
-        raise(e)
+        move_info = best_actions[0]
+    else:
+        move_info = best_actions[randint(0, len(best_actions) - 1)]
+    if not build_state:
+        return (None, move_info), best_q_value
+    return (state.move(move_info), move_info), best_q_value
 
 
-def _reward(state, move_info):
+def _reward(state, move_info, tablebase=None):
     """Returns a reward afer moving to a state."""
     # reward caclulated by kills and game over, and if kinged
     game_over = state.is_game_over()
@@ -143,20 +699,51 @@ def _reward(state, move_info):
         return 100
     if game_over == Player.BLACK:
         return -100
+    if tablebase is not None:
+        # solved positions are worth their exact value
+        exact = tablebase.value(state)
+        if exact is not None:
+            return exact
     reward = len(move_info.kills)
 
-    board = state.board
-    player = state.whose_move
-    kings = 0
-    for y in range(state.board_size):
-        for x in range(state.board_size):
-            piece = board[y][x]
-            if piece.player() == player and piece.is_king():
-                kings += 1
-
-    reward += kings
-
+    counts = state.piece_counts()
     if state.whose_move == Player.RED:
+        reward += counts[Piece.RED_KING]
         return reward
     else:
+        reward += counts[Piece.BLACK_KING]
         return -reward
+
+
+def main(argv=None):
+    # imported here, the trainer is also imported by play and workers
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Trains a q table without '
+                                     'the gui.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--learning-rate', type=float, default=.8)
+    parser.add_argument('--discount', type=float, default=.5)
+    parser.add_argument('--explore-prob', type=float, default=.4)
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--set', nargs='+', default=[], metavar='NAME=value',
+                        help='optional settings, e.g. WORKERS=4 SEED=1')
+    args = parser.parse_args(argv)
+    settings = {'Q_GAMES': args.games, 'LEARNING_RATE': args.learning_rate,
+                'DISCOUNT': args.discount, 'EXPLORE_PROB': args.explore_prob}
+    for spec in args.set:
+        name, _, value = spec.partition('=')
+        settings[name] = parse_value(value)
+    start = perf_counter()
+    Q = q_learning(settings, State(board_size=args.board_size))
+    print(json.dumps({
+        'prefix': cache_prefix(dict(DEFAULT_SETTINGS, **settings),
+                               args.board_size),
+        'games': args.games,
+        'states': len(Q) if hasattr(Q, '__len__') else None,
+        'seconds': perf_counter() - start
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+'''
+q_table.py
+
+A compact binary format for q learning tables. The file is a small header
+followed by the sorted 64 bit state hashes, their float32 q values and their
+uint32 visit counts. Tables are read through mmap, so lookups only touch the
+pages they need and opening a table costs nothing.
+'''
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+from itertools import islice
+
+MAGIC = b'CKQT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQ')
+# header flags
+CANONICAL = 1
+
+
+class CanonicalQ(dict):
+    """A q table keyed by State.canonical_hash instead of generate_hash."""
+    canonical = True
+
+
+class BoundedQ(MutableMapping):
+    """A q table that stays within a memory budget.
+
+    When full, the least visited of the least recently used entries are
+    evicted, using the visit count n stored with every q value. Lookups and
+    writes are counted so the hit rate can be reported.
+    """
+    # measured size of one entry (ordered dict slot, 64 bit key, (q, n)
+    # tuple) once eviction churn has reached a steady state; an insert only
+    # fill is about a quarter smaller. Dict resizes briefly peak higher.
+    ENTRY_BYTES = 300
+
+    def __init__(self, max_bytes=None, capacity=None, canonical=False):
+        if capacity is None:
+            if max_bytes is None:
+                raise ValueError('BoundedQ needs max_bytes or capacity')
+            capacity = max_bytes // self.ENTRY_BYTES
+        self.capacity = max(2, capacity)
+        # evict a batch at a time, chosen among the oldest entries
+        self.batch = max(1, self.capacity // 64)
+        self.canonical = canonical
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._table = OrderedDict()
+
+    def __getitem__(self, key):
+        try:
+            value = self._table[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._table.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        table = self._table
+        if key in table:
+            table.move_to_end(key)
+        elif len(table) >= self.capacity:
+            self._evict()
+        table[key] = value
+
+    def __delitem__(self, key):
+        del self._table[key]
+
+    def __contains__(self, key):
+        return key in self._table
+
+    def __iter__(self):
+        return iter(self._table)
+
+    def __len__(self):
+        return len(self._table)
+
+    # copies made from Q.items() read the table without counting lookups or
+    # reordering entries; dict(Q) looks every key up through __getitem__
+    def keys(self):
+        return list(self._table)
+
+    def items(self):
+        return self._table.items()
+
+    def _evict(self):
+        oldest = list(islice(self._table.items(), 4 * self.batch))
+        oldest.sort(key=lambda item: item[1][1])
+        for key, _ in oldest[:self.batch]:
+            del self._table[key]
+        self.evictions += self.batch
+
+    def stats(self):
+        """Returns the size and hit and miss counts of the table."""
+        lookups = self.hits + self.misses
+        return {'size': len(self._table), 'capacity': self.capacity,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions}
+
+
+def q_key(Q, state):
+    """Returns (key, sign) of a state in Q.
+
+    Values are stored as sign times the q value of the state, so a table
+    that shares entries between a position and its flipped twin can hand
+    out the right value for both.
+    """
+    if getattr(Q, 'canonical', False):
+        return state.canonical_hash()
+    return state.zobrist, 1
+
+
+def state_value(Q, state):
+    """Returns the value of state in Q from red's point of view, or None.
+
+    Q can also be a model with a value method, such as approx_q.LinearQ,
+    which values every state.
+    """
+    if hasattr(Q, 'successor_values'):
+        return Q.value(state)
+    hash, sign = q_key(Q, state)
+    entry = Q.get(hash)
+    return sign * entry[0] if entry is not None else None
+
+
+def is_table_file(file_location):
+    """Returns true if the file is in the compact table format."""
+    with open(file_location, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def save_table(Q, file_location):
+    """Writes a {hash: (q, n)} table in the compact format."""
+    flags = CANONICAL if getattr(Q, 'canonical', False) else 0
+    items = sorted(Q.items())
+    keys = array('Q', (key for key, _ in items))
+    q_values = array('f', (q for _, (q, _) in items))
+    visits = array('I', (min(n, 0xffffffff) for _, (_, n) in items))
+    if sys.byteorder != 'little':
+        for a in (keys, q_values, visits):
+            a.byteswap()
+    with open(file_location, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, flags, len(keys)))
+        keys.tofile(file)
+        q_values.tofile(file)
+        visits.tofile(file)
+
+
+class MappedQ(Mapping):
+    """A read only q table backed by a memory mapped table file."""
+    def __init__(self, file_location):
+        if sys.byteorder != 'little':
+            raise ValueError('memory mapped tables need a little endian host')
+        with open(file_location, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError('%s is not a q table file' % file_location)
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        self._keys = view[start:start + 8 * count].cast('Q')
+        start += 8 * count
+        self._q_values = view[start:start + 4 * count].cast('f')
+        start += 4 * count
+        self._visits = view[start:start + 4 * count].cast('I')
+        self._count = count
+        self.canonical = bool(flags & CANONICAL)
+        self.file_location = file_location
+
+    def __reduce__(self):
+        # other processes map the same file instead of copying the table
+        return (MappedQ, (self.file_location,))
+
+    def _find(self, key):
+        i = bisect_left(self._keys, key)
+        if i < self._count and self._keys[i] == key:
+            return i
+        return -1
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._q_values[i], self._visits[i]
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def arrays(self):
+        """Returns the sorted keys, q values and visits as memoryviews."""
+        return self._keys, self._q_values, self._visits
+
+    def to_dict(self):
+        """Copies the table into a regular dict, e.g. to keep training it."""
+        table = CanonicalQ() if self.canonical else {}
+        table.update(zip(self._keys, zip(self._q_values, self._visits)))
+        return table
+
+    def close(self):
+        """Releases the memory map."""
+        for view in (self._keys, self._q_values, self._visits):
+            view.release()
+        self._mmap.close()
@@ -0,0 +1,231 @@
+'''
+search.py
+
+A search based player for a checkers game. Runs an iterative deepening
+alpha-beta search with a transposition table and uses the q learning values
+(or a material count for unknown positions) to evaluate the leaves.
+'''
+
+from math import copysign
+from time import perf_counter
+
+from q_table import state_value
+from state import Piece, Player, State
+
+WIN_VALUE = 100
+# score of a won position inside the search, less the moves to the win. It
+# is out of reach of any leaf value, so a found win is never mistaken for a
+# good q value; move reports it on the WIN_VALUE scale of the q values
+MATE_VALUE = 10000
+# material values used when a position is not in the q table
+PAWN_VALUE = 1
+KING_VALUE = 2
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# players kept by move, one per table of q values
+MAX_PLAYERS = 4
+_players = {}
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time or node budget runs out."""
+
+
+def material(state):
+    """Scores a state by its pieces, positive when red is ahead."""
+    counts = state.piece_counts()
+    return (PAWN_VALUE * (counts[Piece.RED_PAWN] - counts[Piece.BLACK_PAWN]) +
+            KING_VALUE * (counts[Piece.RED_KING] - counts[Piece.BLACK_KING]))
+
+
+class AlphaBetaPlayer:
+    """Picks moves by alpha-beta search within a per move budget.
+
+    Values are from red's point of view like the q values. The
+    transposition table is kept between moves, so reuse one player for a
+    whole game. Entries are stamped with the move that stored them and a
+    full table keeps only those of the last move.
+    """
+    def __init__(self, Q_VALUES=None, time_limit=0.5, node_limit=None,
+                 max_depth=32, table_size=1000000):
+        self.Q_VALUES = Q_VALUES if Q_VALUES is not None else {}
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.table_size = table_size
+        self.table = {}
+        self.age = 0
+        self.nodes = 0
+        self.depth = 0
+        self._deadline = None
+
+    def evaluate(self, state):
+        """Leaf value of a state from red's point of view."""
+        value = state_value(self.Q_VALUES, state)
+        return value if value is not None else material(state)
+
+    def move(self, maximize, state):
+        """Searches from state; returns ((new_state, move_info), value)."""
+        # search on a copy, an aborted search leaves moves played on it
+        root = State(board=state.board, whose_move=state.whose_move,
+                     board_size=state.board_size, zobrist=state.zobrist)
+        sign = 1 if maximize else -1
+        self.nodes = 0
+        self._deadline = None
+        if self.time_limit is not None:
+            self._deadline = perf_counter() + self.time_limit
+        self.age += 1
+        if len(self.table) > self.table_size:
+            self._age_table()
+
+        moves = self._ordered_moves(root, None)
+        best_move, best_value = moves[0], None
+        for depth in range(1, self.max_depth + 1):
+            try:
+                move_info, value = self._search_root(
+                    root, moves, depth, sign, check_budget=depth > 1)
+            except SearchTimeout:
+                break
+            best_move, best_value = move_info, value
+            self.depth = depth
+            # search the best move first at the next depth
+            moves.remove(move_info)
+            moves.insert(0, move_info)
+            if abs(value) >= MATE_VALUE - self.max_depth:
+                break
+        if best_value is None:
+            best_value = 0
+        elif abs(best_value) >= MATE_VALUE - self.max_depth:
+            best_value = copysign(WIN_VALUE - (MATE_VALUE - abs(best_value)),
+                                  best_value)
+        return (state.move(best_move), best_move), sign * best_value
+
+    def _age_table(self):
+        """Drops the entries stored before the last move, or all of them
+        when the last move alone filled the table."""
+        last = self.age - 1
+        self.table = {hash: entry for hash, entry in self.table.items()
+                      if entry[4] >= last}
+        if len(self.table) > self.table_size:
+            self.table.clear()
+
+    def _check_budget(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and self.nodes % 256 == 0 and \
+                perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+    def _search_root(self, state, moves, depth, sign, check_budget):
+        alpha = float('-inf')
+        beta = float('inf')
+        best_move = moves[0]
+        for move_info in moves:
+            undo = state.make_move(move_info)
+            value = -self._negamax(state, depth - 1, -beta, -alpha, -sign, 1,
+                                   check_budget)
+            state.unmake_move(undo)
+            if value > alpha:
+                alpha = value
+                best_move = move_info
+        return best_move, alpha
+
+    def _negamax(self, state, depth, alpha, beta, sign, ply, check_budget):
+        self.nodes += 1
+        if check_budget:
+            self._check_budget()
+        # values are stored from the searching side's point of view
+        hash = state.generate_hash() * 2 + (sign > 0)
+        entry = self.table.get(hash)
+        best_steps = None
+        if entry is not None:
+            entry_depth, value, flag, best_steps, _ = entry
+            value = self._from_table(value, ply)
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        moves = self._ordered_moves(state, best_steps)
+        if not moves:
+            # the player to move has lost
+            winner = Player(state.whose_move % 2 + 1)
+            value = MATE_VALUE - ply
+            return sign * (value if winner == Player.RED else -value)
+        if depth <= 0:
+            return sign * self.evaluate(state)
+
+        alpha_start = alpha
+        best_value = float('-inf')
+        for move_info in moves:
+            undo = state.make_move(move_info)
+            value = -self._negamax(state, depth - 1, -beta, -alpha, -sign,
+                                   ply + 1, check_budget)
+            state.unmake_move(undo)
+            if value > best_value:
+                best_value = value
+                best_steps = move_info.steps
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best_value <= alpha_start:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[hash] = (depth, self._to_table(best_value, ply), flag,
+                            best_steps, self.age)
+        return best_value
+
+    def _to_table(self, value, ply):
+        """Counts the moves to a win from this position instead of from the
+        root, so the entry holds wherever the position is met again."""
+        if value >= MATE_VALUE - self.max_depth:
+            return value + ply
+        if value <= -(MATE_VALUE - self.max_depth):
+            return value - ply
+        return value
+
+    def _from_table(self, value, ply):
+        """Reverses _to_table for a position ply moves from the root."""
+        if value >= MATE_VALUE - self.max_depth:
+            return value - ply
+        if value <= -(MATE_VALUE - self.max_depth):
+            return value + ply
+        return value
+
+    def _ordered_moves(self, state, best_steps):
+        """Legal moves with the table move first, then the biggest captures."""
+        moves = list(state.legal_moves())
+        moves.sort(key=lambda m: (m.steps != best_steps, -len(m.kills)))
+        return moves
+
+
+def move(maximize, state, Q_VALUES, time_limit=0.5, node_limit=None):
+    """Make a move by searching, with the same result as player.move.
+
+    The player of each Q_VALUES is kept, so its transposition table carries
+    over to the next move of the game.
+    """
+    entry = _players.get(id(Q_VALUES))
+    if entry is None or entry[0] is not Q_VALUES:
+        if len(_players) >= MAX_PLAYERS:
+            del _players[next(iter(_players))]
+        # the table is held too, so its id is not reused while it is kept
+        entry = _players[id(Q_VALUES)] = (Q_VALUES,
+                                          AlphaBetaPlayer(Q_VALUES))
+    player = entry[1]
+    player.time_limit = time_limit
+    player.node_limit = node_limit
+    return player.move(maximize, state)
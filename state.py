@@ -4,11 +4,15 @@ state.py
 A state class for a checkers game.
 '''
 
-from collections import namedtuple
 from enum import IntEnum
-from random import randint
+from random import Random, randint
 
-Location = namedtuple('Location', ['x', 'y'])
+from geometry import Location, geometry
+
+# a game is drawn when the same position comes up this many times
+DRAW_REPETITIONS = 3
+# or after this many moves in a row without a capture or a pawn move
+DRAW_MOVES = 80
 
 
 class Piece(IntEnum):
@@ -46,18 +50,83 @@ class Player(IntEnum):
     RED = 1
 
 
+# lookups indexed by piece or player value for the move generation loops,
+# which avoids Piece.player() and Piece.is_king() calls
+_OWNER = (None, Player.BLACK, Player.RED, Player.BLACK, Player.RED)
+_CROWNED = (Piece.EMPTY, Piece.BLACK_KING, Piece.RED_KING, Piece.BLACK_KING,
+            Piece.RED_KING)
+_OPPONENT = (None, Player.BLACK, Player.RED)
+_PIECES = tuple(sorted(Piece))
+
+
 def _create_initial_board(size):
     """Generates the starting position of the game."""
-    b = [[Piece.EMPTY for _ in range(size)] for _ in range(size)]
-    for x in range(size):
-        for y in range(size):
-            if y < size / 2 - 1:
-                if x % 2 != y % 2:
-                    b[y][x] = Piece.BLACK_PAWN
-            if y >= size / 2 + 1:
-                if x % 2 != y % 2:
-                    b[y][x] = Piece.RED_PAWN
-    return b
+    return [[_PIECES[p] for p in row] for row in geometry(size).initial_board]
+
+_zobrist_tables = {}
+
+
+def zobrist_table(size):
+    """Returns the zobrist keys for a board size.
+
+    keys[y * size + x][piece] is a random 64 bit key (zero for an empty square)
+    and side is the key that is mixed in when black is to move. The keys are
+    seeded by the board size so hashes are stable across processes and runs.
+    """
+    table = _zobrist_tables.get(size)
+    if table is None:
+        rng = Random(size)
+        keys = tuple((0,) + tuple(rng.getrandbits(64) for _ in range(4))
+                     for _ in range(size * size))
+        table = _zobrist_tables[size] = (keys, rng.getrandbits(64))
+    return table
+
+
+def zobrist_hash(board, whose_move, size):
+    """Computes the zobrist hash of a board from scratch."""
+    keys, side = zobrist_table(size)
+    h = side if whose_move == Player.BLACK else 0
+    for y in range(size):
+        row = board[y]
+        for x in range(size):
+            h ^= keys[y * size + x][row[x]]
+    return h
+
+
+# a piece seen from the other side of the board
+_SWAPPED_COLOR = (Piece.EMPTY, Piece.RED_PAWN, Piece.BLACK_PAWN,
+                  Piece.RED_KING, Piece.BLACK_KING)
+_flipped_tables = {}
+
+
+def flipped_zobrist_table(size):
+    """Returns keys that hash a board as if it were flipped.
+
+    The flipped board is rotated 180 degrees with the colors swapped, which
+    is the same position for the other player. Hashing a board with these
+    keys, mixing in the side key when red is to move, gives the zobrist hash
+    of the flipped position.
+    """
+    table = _flipped_tables.get(size)
+    if table is None:
+        keys, side = zobrist_table(size)
+        last = size * size - 1
+        flipped = tuple(tuple(keys[last - i][_SWAPPED_COLOR[p]]
+                              for p in range(len(Piece)))
+                        for i in range(size * size))
+        table = _flipped_tables[size] = (flipped, side)
+    return table
+
+
+def flipped_zobrist_hash(board, whose_move, size):
+    """Computes the zobrist hash of the flipped board from scratch."""
+    keys, side = flipped_zobrist_table(size)
+    h = side if whose_move == Player.RED else 0
+    for y in range(size):
+        row = board[y]
+        for x in range(size):
+            h ^= keys[y * size + x][row[x]]
+    return h
 
 #INITIAL_BOARD = _create_initial_board()
 '''b = [[Piece.EMPTY for _ in range(8)] for _ in range(8)]
@@ -69,10 +138,25 @@ INITIAL_BOARD = b
 
 class State:
     """The state space for the game."""
-    def __init__(self, board=None, whose_move=Player.BLACK, board_size=8):
+    def __init__(self, board=None, whose_move=Player.BLACK, board_size=8,
+                 zobrist=None, flipped_zobrist=None):
         self.board = [r[:] for r in board] if board is not None else _create_initial_board(board_size)
         self.board_size = board_size
         self.whose_move = whose_move
+        # callers that already know the hashes (State.move) pass them in
+        self.zobrist = zobrist if zobrist is not None else zobrist_hash(
+            self.board, whose_move, board_size)
+        self.flipped_zobrist = flipped_zobrist \
+            if flipped_zobrist is not None else flipped_zobrist_hash(
+                self.board, whose_move, board_size)
+        # computed on first use; make_move clears them and unmake_move puts
+        # them back, change the board through those two only
+        self._clear_cache()
+
+    def _clear_cache(self):
+        self._moves = None
+        self._counts = None
+        self._game_over = None
 
     def __repr__(self):
         res = '_________________________________\n'
@@ -90,147 +174,191 @@ class State:
 
     def is_game_over(self):
         """Returns true if one player has run out of pieces."""
-        n_reds = 0
-        n_blacks = 0
-        board = self.board
-        for y in range(self.board_size):
-            for x in range(self.board_size):
-                piece = board[y][x]
-                if piece.player() == Player.BLACK:
-                    n_blacks += 1
-                elif piece.player() == Player.RED:
-                    n_reds += 1
-        if n_reds == 0:
-            # print("Black wins.")
-            return Player.BLACK
-        if n_blacks == 0:
-            # print("Red wins.")
-            return Player.RED
-
-        if len(self.generate_successors()) == 0:
-            return Player(self.whose_move % 2 + 1)
-        return 0
+        if self._game_over is None:
+            counts = self.piece_counts()
+            if counts[Piece.RED_PAWN] + counts[Piece.RED_KING] == 0:
+                # print("Black wins.")
+                self._game_over = Player.BLACK
+            elif counts[Piece.BLACK_PAWN] + counts[Piece.BLACK_KING] == 0:
+                # print("Red wins.")
+                self._game_over = Player.RED
+            elif not self.legal_moves():
+                self._game_over = _OPPONENT[self.whose_move]
+            else:
+                self._game_over = 0
+        return self._game_over
+
+    def piece_counts(self):
+        """Returns how many of each Piece are on the board, indexed by Piece."""
+        if self._counts is None:
+            counts = [0] * len(Piece)
+            for row in self.board:
+                for piece in row:
+                    counts[piece] += 1
+            self._counts = tuple(counts)
+        return self._counts
+
+    def legal_moves(self):
+        """Returns the list of legal moves, generated once per position."""
+        if self._moves is None:
+            self._moves = list(self.iter_moves())
+        return self._moves
 
     def generate_successors(self, help=False):
         """Returns all possible successor states to the passed state."""
+        return [(self.move(move_info), move_info)
+                for move_info in self.legal_moves()]
+
+    def iter_moves(self):
+        """Yields the legal moves without building successor states.
+
+        The state may be changed with make_move between two moves as long as
+        it is restored with unmake_move before the iterator is advanced.
+        """
         board = self.board
         whose_move = self.whose_move
-        successors = []
+        locations = geometry(self.board_size).grid
+        simple_moves = []
         has_kills = False
         for y in range(self.board_size):
             for x in range(self.board_size):
-                piece = board[y][x]
-                if piece.player() == whose_move:
-                    moves = self.generate_moves(
-                        Location(x, y), needs_kill=has_kills)
-                    if not has_kills:
-                        for s, m in moves:
-                            if len(m.kills) > 0:
-                                has_kills = True
-                                break
-                    successors += moves
-        if has_kills:
-            new_moves = []
-            for (s, m) in successors:
-                if len(m.kills) > 0:
-                    new_moves.append((s, m))
-            return new_moves
-        return successors
-
-    def move(self, move_info):
-        """Moves one piece."""
+                if _OWNER[board[y][x]] == whose_move:
+                    for move_info in self._piece_moves(locations[y][x],
+                                                       has_kills):
+                        if move_info.kills:
+                            has_kills = True
+                            yield move_info
+                        else:
+                            simple_moves.append(move_info)
+        if not has_kills:
+            yield from simple_moves
+
+    def make_move(self, move_info):
+        """Plays a move on this state in place and returns an undo record."""
         loc = move_info.steps[0]
         new_loc = move_info.steps[-1]
-        state = State(board=self.board, whose_move=Player(
-            self.whose_move % 2 + 1), board_size=self.board_size)
-        state.board[new_loc.y][new_loc.x] = state.board[loc.y][loc.x]
-        state.board[loc.y][loc.x] = Piece.EMPTY
-        piece = state.board[new_loc.y][new_loc.x]
-        if not piece.is_king():
-            if new_loc.y == self.board_size - 1 or new_loc.y == 0:
-                state.board[new_loc.y][new_loc.x] = Piece(piece + 2)
+        size = self.board_size
+        keys, side = zobrist_table(size)
+        flipped_keys = flipped_zobrist_table(size)[0]
+        board = self.board
+        piece = board[loc.y][loc.x]
+        start = loc.y * size + loc.x
+        end = new_loc.y * size + new_loc.x
+        h = self.zobrist ^ side ^ keys[start][piece]
+        fh = self.flipped_zobrist ^ side ^ flipped_keys[start][piece]
+        board[loc.y][loc.x] = Piece.EMPTY
+        replaced = board[new_loc.y][new_loc.x]
+        captured = []
+        undo = (move_info, piece, replaced, captured,
+                (self.zobrist, self.flipped_zobrist), self.whose_move,
+                (self._moves, self._counts, self._game_over))
+        self._clear_cache()
+        if new_loc.y == size - 1 or new_loc.y == 0:
+            piece = _CROWNED[piece]
+        h ^= keys[end][replaced] ^ keys[end][piece]
+        fh ^= flipped_keys[end][replaced] ^ flipped_keys[end][piece]
+        board[new_loc.y][new_loc.x] = piece
 
         for (x, y) in move_info.kills:
-            state.board[y][x] = Piece.EMPTY
+            killed = board[y][x]
+            captured.append(killed)
+            h ^= keys[y * size + x][killed]
+            fh ^= flipped_keys[y * size + x][killed]
+            board[y][x] = Piece.EMPTY
+        self.zobrist = h
+        self.flipped_zobrist = fh
+        self.whose_move = _OPPONENT[self.whose_move]
+        return undo
+
+    def unmake_move(self, undo):
+        """Takes back a move played with make_move."""
+        move_info, piece, replaced, captured, hashes, whose_move, cache = undo
+        loc = move_info.steps[0]
+        new_loc = move_info.steps[-1]
+        board = self.board
+        for (x, y), p in zip(move_info.kills, captured):
+            board[y][x] = p
+        board[new_loc.y][new_loc.x] = replaced
+        board[loc.y][loc.x] = piece
+        self.zobrist, self.flipped_zobrist = hashes
+        self.whose_move = whose_move
+        self._moves, self._counts, self._game_over = cache
+
+    def move(self, move_info):
+        """Moves one piece."""
+        state = State(board=self.board, whose_move=self.whose_move,
+                      board_size=self.board_size, zobrist=self.zobrist,
+                      flipped_zobrist=self.flipped_zobrist)
+        state.make_move(move_info)
         return state
-    # generate moves for specific location and piece, recrusive for kills
-    def generate_moves(self, loc, needs_kill=False, current_move_info=None):
-        """Returns all possible moves from the current state."""
+
+    # generate moves for specific location and piece, follows kills in place
+    def generate_moves(self, loc, needs_kill=False):
+        """Returns all possible moves of the piece at loc."""
+        return [(self.move(move_info), move_info)
+                for move_info in self._piece_moves(loc, needs_kill)]
+
+    def _piece_moves(self, loc, needs_kill):
+        """Yields the moves of the piece at loc as MoveInfos."""
         board = self.board
         whose_move = self.whose_move
+        opponent = _OPPONENT[whose_move]
+        size = self.board_size
+        steps = geometry(size).steps
         piece = board[loc.y][loc.x]
-        player = piece.player()
-        moves = []
-
-        def gen_diagonals(loc):
-            d = []
-            if player == Player.BLACK or piece.is_king():
-                d += [
-                    Location(loc.x + 1, loc.y + 1),
-                    Location(loc.x - 1, loc.y + 1)
-                ]
-            if player == Player.RED or piece.is_king():
-                d += [
-                    Location(loc.x + 1, loc.y - 1),
-                    Location(loc.x - 1, loc.y - 1)
-                ]
-            return d
-
-        def check_bounds(loc):
-            x, y = loc
-            if x < 0 or x > self.board_size - 1:
-                return False
-            if y < 0 or y > self.board_size - 1:
-                return False
-            return True
-
-        for x, y in gen_diagonals(loc):
-            if check_bounds((x, y)):
-                opp = board[y][x].player()
-            else:
+
+        for near, far in steps[piece][loc.y][loc.x]:
+            owner = _OWNER[board[near.y][near.x]]
+            if owner is None:
+                if not needs_kill:
+                    yield MoveInfo([loc, near], [])
                 continue
-            if opp != whose_move:
-                if opp is None:
-                    if not needs_kill:
-                        move_info = MoveInfo([loc, Location(x, y)], [])
-                        new_state = self.move(move_info)
-                        moves.append((new_state, move_info))
+            if owner != opponent or far is None or \
+                    board[far.y][far.x] != Piece.EMPTY:
+                continue
+            # play the hops on the board to follow the chain of kills, a
+            # chain can only go one way: the first further jump found
+            move_info = MoveInfo([loc, far], [near])
+            changed = []
+            start, kill, land = loc, near, far
+            current = piece
+            while kill is not None:
+                changed += [(start, board[start.y][start.x]),
+                            (kill, board[kill.y][kill.x]),
+                            (land, board[land.y][land.x])]
+                board[start.y][start.x] = Piece.EMPTY
+                board[kill.y][kill.x] = Piece.EMPTY
+                if land.y == 0 or land.y == size - 1:
+                    current = _CROWNED[current]
+                board[land.y][land.x] = current
+                start = land
+                for kill, land in steps[current][start.y][start.x]:
+                    if land is not None and \
+                            _OWNER[board[kill.y][kill.x]] == opponent and \
+                            board[land.y][land.x] == Piece.EMPTY:
+                        move_info.kills.append(kill)
+                        move_info.steps.append(land)
+                        break
                 else:
-                    xx = x + (x - loc.x)
-                    yy = y + (y - loc.y)
-                    if check_bounds((xx, yy)):
-                        p = board[yy][xx]
-                        if p == Piece.EMPTY:
-                            move_info = current_move_info or MoveInfo([loc], [])
-                            move_info.kills.append(Location(x, y))
-                            move_info.steps.append(Location(xx, yy))
-                            s = self.move(
-                                MoveInfo([loc, Location(xx, yy)], [Location(x, y)]))
-
-                            s.whose_move = whose_move
-                            s.generate_moves(
-                                Location(xx, yy), True, move_info)
-
-                            if current_move_info is None:
-                                new_state = self.move(move_info)
-                                moves.append((new_state, move_info))
-                            else:
-                                # break after first successive jump is found,
-                                # can only go one way
-                                break
-                    else:
-                        continue
-        return moves
-
+                    kill = None
+            for (cx, cy), p in reversed(changed):
+                board[cy][cx] = p
+            yield move_info
 
     def generate_hash(self):
-        """Generates a zobrist hash string of the state."""
-        hash = 0
-        board = self.board
-        whose_move = self.whose_move
-        flattened = [str(int(board[y][x])) for y in range(self.board_size)
-                     for x in range(self.board_size)] + [str(int(whose_move))]
-        return ''.join(flattened)
+        """Returns the 64 bit zobrist hash of the state."""
+        return self.zobrist
+
+    def canonical_hash(self):
+        """Returns (hash, sign) for the state or its flipped twin.
+
+        A position and the same position flipped for the other player share
+        one key; sign is -1 when the key is the flipped one, since the q
+        values are from red's point of view and have to be negated.
+        """
+        if self.zobrist <= self.flipped_zobrist:
+            return self.zobrist, 1
+        return self.flipped_zobrist, -1
 
 
     def get_winner(self):
@@ -244,9 +372,44 @@ class State:
 
 class MoveInfo:
     """info representing a move."""
-    def __init__(self, steps=[], kills=[]):
-        self.steps = steps
-        self.kills = kills
+    __slots__ = ('steps', 'kills')
+
+    def __init__(self, steps=None, kills=None):
+        self.steps = steps if steps is not None else []
+        self.kills = kills if kills is not None else []
 
     def __repr__(self):
         return 'steps: %r\nkills: %r' % (self.steps, self.kills)
+
+
+class GameHistory:
+    """The positions of a game so far, for the draw rules.
+
+    Captures and pawn moves can never be undone, so the positions before
+    them are forgotten and only the ones since the last such move are kept.
+    """
+    __slots__ = ('counts', 'quiet_moves')
+
+    def __init__(self, state=None):
+        self.counts = {}
+        self.quiet_moves = 0
+        if state is not None:
+            self.counts[state.zobrist] = 1
+
+    def push(self, state, move_info, new_state):
+        """Records playing move_info from state.
+
+        Returns true if new_state is a draw: its third repetition or the
+        DRAW_MOVES move without a capture or a pawn move.
+        """
+        x, y = move_info.steps[0]
+        piece = state.board[y][x]
+        if move_info.kills or piece == Piece.BLACK_PAWN or \
+                piece == Piece.RED_PAWN:
+            self.counts.clear()
+            self.quiet_moves = 0
+        else:
+            self.quiet_moves += 1
+        count = self.counts.get(new_state.zobrist, 0) + 1
+        self.counts[new_state.zobrist] = count
+        return count >= DRAW_REPETITIONS or self.quiet_moves >= DRAW_MOVES
@@ -0,0 +1,257 @@
+'''
+sweep.py
+
+Searches q learning settings without the gui. Every configuration of a grid
+or of a random search is trained in a pool of worker processes, reusing the
+cached tables of configurations that were trained before, then played
+against a baseline, and the results are printed as a table ranked by score.
+
+    python sweep.py --grid LEARNING_RATE=.2,.5,.8 DISCOUNT=.5,.9 --games 1000
+    python sweep.py --random 20 LEARNING_RATE=.1:.9 EXPLORE_PROB=.1:.6
+'''
+
+import argparse
+import json
+from itertools import product
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+from os import cpu_count
+from os.path import isfile
+from random import Random
+from time import perf_counter
+
+from q_learning import (DEFAULT_SETTINGS, cache_prefix, load_q, parse_value,
+                        q_learning)
+from state import State
+from tournament import run_match
+
+# settings a sweep starts from, the swept parameters are set on top
+BASE_SETTINGS = {
+    'Q_GAMES': 1000,
+    'LEARNING_RATE': .8,
+    'DISCOUNT': .5,
+    'EXPLORE_PROB': .4
+}
+
+
+def parse_parameters(specs):
+    """Turns NAME=a,b,c and NAME=low:high arguments into a dict.
+
+    Lists become lists of values and ranges become (low, high) tuples.
+    """
+    parameters = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if not values:
+            raise ValueError('expected NAME=values, got %r' % spec)
+        if ':' in values:
+            low, high = values.split(':')
+            parameters[name] = (float(low), float(high))
+        else:
+            parameters[name] = [parse_value(v) for v in values.split(',')]
+    return parameters
+
+
+def grid(parameters):
+    """Yields every combination of the listed values."""
+    for name, values in parameters.items():
+        if isinstance(values, tuple):
+            raise ValueError('a grid needs lists of values, %s is a range'
+                             % name)
+    names = list(parameters)
+    for values in product(*(parameters[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def random_search(parameters, count, rng):
+    """Yields count configurations sampled from the values or ranges.
+
+    Samples from a range are whole numbers for settings whose default is
+    one, such as Q_GAMES and BATCH_SIZE.
+    """
+    defaults = dict(DEFAULT_SETTINGS, **BASE_SETTINGS)
+    for _ in range(count):
+        config = {}
+        for name, values in parameters.items():
+            default = defaults.get(name)
+            if isinstance(values, tuple):
+                value = rng.uniform(*values)
+                if isinstance(default, int) and \
+                        not isinstance(default, bool):
+                    config[name] = int(round(value))
+                else:
+                    # one decimal, like the names of the cache files
+                    config[name] = round(value, 1)
+            else:
+                config[name] = rng.choice(values)
+        yield config
+
+
+def _evaluate(task):
+    """Trains one configuration and plays it against the baseline."""
+    i, settings, board_size, baseline, eval_games, max_moves, match_seed = task
+    prefix = cache_prefix(settings, board_size)
+    # approximate models are cached as weights, see approx_q
+    extension = '.weights.json' if settings.get('APPROXIMATE') else '.save'
+    cached = isfile('%s-%d%s' % (prefix, settings['Q_GAMES'], extension))
+    start = perf_counter()
+    Q = q_learning(settings, initial_state=State(board_size=board_size))
+    seconds = perf_counter() - start
+    if isinstance(baseline, str):
+        baseline = load_q(baseline)
+    result = run_match(Q, baseline, eval_games, board_size, max_moves,
+                       workers=1, match_seed=match_seed)
+    return {'index': i, 'settings': settings, 'cached': cached,
+            'train_seconds': seconds,
+            # approximate models have weights instead of states
+            'states': len(Q) if hasattr(Q, '__len__') else 0,
+            'score': result['score'], 'score_95ci': result['score_95ci'],
+            'wins': result['wins'], 'draws': result['draws'],
+            'losses': result['losses']}
+
+
+def _sweep_worker(connection):
+    """Evaluates the tasks sent by _run_tasks until it sends None."""
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        try:
+            result = _evaluate(task)
+        except Exception as exc:
+            result = exc
+        connection.send(result)
+    connection.close()
+
+
+def _run_tasks(tasks, workers):
+    """Runs _evaluate over tasks in worker processes, in any order.
+
+    The workers are not daemons, unlike those of a multiprocessing.Pool, so
+    training with WORKERS > 1 can start its own processes inside them.
+    """
+    connections = []
+    processes = []
+    for _ in range(min(workers, len(tasks))):
+        parent, child = Pipe()
+        process = Process(target=_sweep_worker, args=(child,))
+        process.start()
+        child.close()
+        connections.append(parent)
+        processes.append(process)
+    pending = list(reversed(tasks))
+    results = []
+    try:
+        for connection in connections:
+            connection.send(pending.pop())
+        while len(results) < len(tasks):
+            for connection in wait(connections):
+                result = connection.recv()
+                if isinstance(result, Exception):
+                    raise result
+                results.append(result)
+                if pending:
+                    connection.send(pending.pop())
+    finally:
+        for connection in connections:
+            connection.send(None)
+            connection.close()
+        for process in processes:
+            process.join()
+    return results
+
+
+def run_sweep(configs, base_settings=None, board_size=8, baseline=None,
+              eval_games=200, max_moves=200, workers=None, match_seed=0):
+    """Trains and evaluates configurations, returns results by score.
+
+    Each configuration is laid over base_settings. The baseline is a q table
+    or a path to a saved table; the default empty table plays random moves.
+    """
+    base_settings = dict(BASE_SETTINGS, **(base_settings or {}))
+    baseline = baseline if baseline is not None else {}
+    tasks = []
+    seen = []
+    for config in configs:
+        settings = dict(base_settings, **config)
+        # the same configuration twice would train the same table twice
+        if settings in seen:
+            continue
+        seen.append(settings)
+        tasks.append((len(tasks), settings, board_size, baseline,
+                      eval_games, max_moves, match_seed))
+    if workers is None:
+        workers = cpu_count() or 1
+    if workers == 1:
+        results = [_evaluate(task) for task in tasks]
+    else:
+        results = _run_tasks(tasks, workers)
+    results.sort(key=lambda r: (-r['score'], r['index']))
+    return results
+
+
+def format_table(results, names):
+    """Formats results as a ranked text table of the swept settings."""
+    header = ['rank'] + names + ['score', '95% ci', 'w/d/l', 'states',
+                                 'train s']
+    rows = []
+    for rank, r in enumerate(results, 1):
+        rows.append([str(rank)] +
+                    [str(r['settings'].get(name)) for name in names] +
+                    ['%.3f' % r['score'],
+                     '%.3f-%.3f' % tuple(r['score_95ci']),
+                     '%d/%d/%d' % (r['wins'], r['draws'], r['losses']),
+                     str(r['states']),
+                     'cached' if r['cached'] else '%.1f' % r['train_seconds']])
+    widths = [max(len(row[i]) for row in [header] + rows)
+              for i in range(len(header))]
+    return '\n'.join('  '.join(cell.rjust(width)
+                               for cell, width in zip(row, widths))
+                     for row in [header] + rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Trains and ranks q '
+                                     'learning settings without the gui.')
+    search = parser.add_mutually_exclusive_group(required=True)
+    search.add_argument('--grid', nargs='+', metavar='NAME=a,b,c',
+                        help='every combination of the listed values')
+    search.add_argument('--random', type=int, metavar='N',
+                        help='N random picks from the parameters that follow')
+    parser.add_argument('parameters', nargs='*', metavar='NAME=values',
+                        help='for --random: NAME=a,b,c or NAME=low:high')
+    parser.add_argument('--set', nargs='+', default=[], metavar='NAME=value',
+                        help='fixed settings, e.g. SYMMETRY=true')
+    parser.add_argument('--games', type=int, default=BASE_SETTINGS['Q_GAMES'],
+                        help='training games per configuration')
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--baseline', help='saved table to play against, '
+                        'random moves by default')
+    parser.add_argument('--eval-games', type=int, default=200)
+    parser.add_argument('--max-moves', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the results as JSON')
+    args = parser.parse_args(argv)
+
+    base_settings = {'Q_GAMES': args.games, 'SEED': args.seed}
+    for spec in args.set:
+        name, _, value = spec.partition('=')
+        base_settings[name] = parse_value(value)
+    if args.grid:
+        parameters = parse_parameters(args.grid)
+        configs = grid(parameters)
+    else:
+        parameters = parse_parameters(args.parameters)
+        configs = random_search(parameters, args.random, Random(args.seed))
+    results = run_sweep(configs, base_settings, args.board_size,
+                        args.baseline, args.eval_games, args.max_moves,
+                        args.workers, args.seed)
+    print(format_table(results, list(parameters)))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
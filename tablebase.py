@@ -0,0 +1,325 @@
+'''
+tablebase.py
+
+Endgame tablebases solved by retrograde analysis. Every position with up to
+a few pieces on a board size is generated with the bitboard engine, the lost
+and won positions are propagated backwards from the finished games, and what
+is never resolved is a draw. The result and the number of moves to the end
+are stored per position in a compact file that is read through mmap.
+
+    python tablebase.py --board-size 8 --pieces 3
+'''
+
+import mmap
+import struct
+import sys
+from array import array
+from collections import deque
+from itertools import combinations, product
+from math import comb
+from os import makedirs, replace
+from os.path import dirname, isfile, join
+from time import perf_counter
+
+from bitboard import BitboardState
+from geometry import geometry
+from state import Piece, Player
+
+MAGIC = b'CKTB'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHQ')
+TABLEBASE_DIR = 'cache'
+DEFAULT_PIECES = 3
+
+# results, for the player to move
+UNKNOWN = 0
+WIN = 1
+LOSS = 2
+DRAW = 3
+
+# value of a won position, less the moves it takes, like search.WIN_VALUE
+WIN_VALUE = 100
+
+_tablebases = {}
+
+
+def _offsets(n_squares, max_pieces):
+    """Returns the first index of the positions with k pieces, for each k."""
+    offsets = [0, 0]
+    for k in range(1, max_pieces + 1):
+        offsets.append(offsets[-1] + comb(n_squares, k) * 4 ** k * 2)
+    return offsets
+
+
+def _index(offsets, pieces, whose_move):
+    """Index of a position from its (square, Piece) list sorted by square.
+
+    Squares are ranked as a combination in colex order, then the piece kinds
+    are a base 4 number and the player to move is the last digit.
+    """
+    rank = 0
+    kinds = 0
+    for i, (square, piece) in enumerate(pieces):
+        rank += comb(square, i + 1)
+        kinds = kinds * 4 + piece - 1
+    return (offsets[len(pieces)] + (rank * 4 ** len(pieces) + kinds) * 2 +
+            whose_move - 1)
+
+
+def _bitboard_pieces(bitboard):
+    """The (square, Piece) list of a bitboard, sorted by square."""
+    pieces = []
+    black, red, kings = bitboard.black, bitboard.red, bitboard.kings
+    occupied = black | red
+    while occupied:
+        low = occupied & -occupied
+        occupied ^= low
+        if black & low:
+            piece = Piece.BLACK_KING if kings & low else Piece.BLACK_PAWN
+        else:
+            piece = Piece.RED_KING if kings & low else Piece.RED_PAWN
+        pieces.append((low.bit_length() - 1, piece))
+    return pieces
+
+
+def _positions(board_size, max_pieces):
+    """Yields every position in index order as a BitboardState."""
+    geo = geometry(board_size)
+    for k in range(1, max_pieces + 1):
+        squares = sorted(combinations(range(geo.n_squares), k),
+                         key=lambda c: c[::-1])
+        for combo in squares:
+            for kinds in product((Piece.BLACK_PAWN, Piece.RED_PAWN,
+                                  Piece.BLACK_KING, Piece.RED_KING),
+                                 repeat=k):
+                black = red = kings = 0
+                for square, piece in zip(combo, kinds):
+                    if piece == Piece.BLACK_PAWN or piece == Piece.BLACK_KING:
+                        black |= 1 << square
+                    else:
+                        red |= 1 << square
+                    if piece == Piece.BLACK_KING or piece == Piece.RED_KING:
+                        kings |= 1 << square
+                for whose_move in (Player.RED, Player.BLACK):
+                    yield BitboardState(black, red, kings, whose_move,
+                                        board_size, geo)
+
+
+def build_tablebase(board_size, max_pieces=DEFAULT_PIECES, verbose=False):
+    """Solves every position with up to max_pieces pieces.
+
+    Returns an array of uint16 entries, distance << 2 | result, in index
+    order.
+    """
+    start = perf_counter()
+    geo = geometry(board_size)
+    offsets = _offsets(geo.n_squares, max_pieces)
+    total = offsets[-1]
+    results = bytearray(total)
+    distances = array('H', bytes(2 * total))
+    # successors of position i are edges[starts[i]:starts[i + 1]]
+    starts = array('I', [0])
+    edges = array('I')
+    queue = deque()
+    for i, bitboard in enumerate(_positions(board_size, max_pieces)):
+        paths = bitboard.generate_paths() if bitboard.black and bitboard.red \
+            else None
+        if not paths:
+            # finished games, decided like State.is_game_over
+            if not bitboard.red:
+                winner = Player.BLACK
+            elif not bitboard.black:
+                winner = Player.RED
+            else:
+                winner = bitboard.whose_move % 2 + 1
+            results[i] = WIN if winner == bitboard.whose_move else LOSS
+            queue.append(i)
+        else:
+            other = bitboard.whose_move % 2 + 1
+            edges.extend(_index(offsets, _bitboard_pieces(
+                bitboard.apply(path, kills)), other) for path, kills in paths)
+        starts.append(len(edges))
+    if verbose:
+        print('%d positions, %d moves in %.1fs' %
+              (total, len(edges), perf_counter() - start))
+
+    # predecessors of position i are parents[parent_starts[i]:...[i + 1]]
+    parent_starts = array('I', bytes(4 * (total + 1)))
+    for child in edges:
+        parent_starts[child + 1] += 1
+    for i in range(total):
+        parent_starts[i + 1] += parent_starts[i]
+    fill = array('I', parent_starts)
+    parents = array('I', bytes(4 * len(edges)))
+    for i in range(total):
+        for child in edges[starts[i]:starts[i + 1]]:
+            parents[fill[child]] = i
+            fill[child] += 1
+    remaining = array('I', (starts[i + 1] - starts[i] for i in range(total)))
+    del edges, fill
+
+    # walk back from finished games in order of distance: a position with a
+    # lost successor is won, one whose successors are all won is lost
+    while queue:
+        child = queue.popleft()
+        child_lost = results[child] == LOSS
+        distance = distances[child] + 1
+        for parent in parents[parent_starts[child]:parent_starts[child + 1]]:
+            if results[parent]:
+                continue
+            if child_lost:
+                results[parent] = WIN
+            else:
+                remaining[parent] -= 1
+                if remaining[parent]:
+                    continue
+                results[parent] = LOSS
+            distances[parent] = distance
+            queue.append(parent)
+    table = array('H', [d << 2 | (r or DRAW)
+                        for d, r in zip(distances, results)])
+    if verbose:
+        print('solved in %.1fs: %d won, %d lost, %d drawn' %
+              (perf_counter() - start, results.count(WIN),
+               results.count(LOSS), results.count(UNKNOWN)))
+    return table
+
+
+def save_tablebase(table, board_size, max_pieces, file_location):
+    """Writes a table from build_tablebase."""
+    if dirname(file_location):
+        makedirs(dirname(file_location), exist_ok=True)
+    if sys.byteorder != 'little':
+        table = array('H', table)
+        table.byteswap()
+    with open(file_location + '.tmp', 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, board_size, max_pieces,
+                               len(table)))
+        table.tofile(file)
+    replace(file_location + '.tmp', file_location)
+
+
+class Tablebase:
+    """A solved endgame table read through mmap."""
+    def __init__(self, file_location):
+        if sys.byteorder != 'little':
+            raise ValueError('memory mapped tables need a little endian host')
+        with open(file_location, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, board_size, max_pieces, count = \
+            HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError('%s is not a tablebase file' % file_location)
+        self._table = memoryview(self._mmap)[HEADER.size:].cast('H')
+        self.board_size = board_size
+        self.max_pieces = max_pieces
+        self.file_location = file_location
+        self._geo = geometry(board_size)
+        self._offsets = _offsets(self._geo.n_squares, max_pieces)
+
+    def __reduce__(self):
+        return (Tablebase, (self.file_location,))
+
+    def probe(self, state):
+        """Returns (result, distance) for the player to move, or None.
+
+        None means the position has too many pieces or is for another board
+        size. distance is the number of moves to the end of a won or lost
+        game.
+        """
+        if state.board_size != self.board_size:
+            return None
+        counts = state.piece_counts()
+        if sum(counts) - counts[Piece.EMPTY] > self.max_pieces:
+            return None
+        board = state.board
+        pieces = []
+        for i, (x, y) in enumerate(self._geo.locations):
+            if board[y][x]:
+                pieces.append((i, board[y][x]))
+        if not pieces:
+            return None
+        entry = self._table[_index(self._offsets, pieces, state.whose_move)]
+        return entry & 3, entry >> 2
+
+    def winner(self, state):
+        """Returns the Player that wins with best play, 0 for a draw, or
+        None when the position is not in the table."""
+        entry = self.probe(state)
+        if entry is None:
+            return None
+        result, _ = entry
+        if result == DRAW:
+            return 0
+        if result == WIN:
+            return state.whose_move
+        return Player(state.whose_move % 2 + 1)
+
+    def value(self, state):
+        """Exact value of a position from red's point of view, or None.
+
+        Wins are worth WIN_VALUE less the moves they take, so faster wins
+        and slower losses score better; draws are worth 0.
+        """
+        entry = self.probe(state)
+        if entry is None:
+            return None
+        result, distance = entry
+        if result == DRAW:
+            return 0
+        value = WIN_VALUE - distance
+        if (result == WIN) != (state.whose_move == Player.RED):
+            value = -value
+        return value
+
+    def close(self):
+        """Releases the memory map."""
+        self._table.release()
+        self._mmap.close()
+
+
+def tablebase_path(board_size, max_pieces=DEFAULT_PIECES):
+    return join(TABLEBASE_DIR, 'tablebase-%d-%d.tb' % (board_size,
+                                                       max_pieces))
+
+
+def tablebase(board_size, max_pieces=DEFAULT_PIECES, file_location=None):
+    """Returns the saved tablebase of a board size, or None if there is none.
+
+    Building one takes a while, see build_tablebase and the command line.
+    A file_location that is given has to exist, only the default one may be
+    missing.
+    """
+    default = file_location is None
+    if default:
+        file_location = tablebase_path(board_size, max_pieces)
+    table = _tablebases.get(file_location)
+    if table is None:
+        if not isfile(file_location):
+            if default:
+                return None
+            raise FileNotFoundError('no tablebase at %s' % file_location)
+        table = _tablebases[file_location] = Tablebase(file_location)
+    return table
+
+
+def main(argv=None):
+    # imported here, training imports this module without its command line
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Builds an endgame '
+                                     'tablebase.')
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--pieces', type=int, default=DEFAULT_PIECES)
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+    file_location = args.output or tablebase_path(args.board_size,
+                                                  args.pieces)
+    table = build_tablebase(args.board_size, args.pieces, verbose=True)
+    save_tablebase(table, args.board_size, args.pieces, file_location)
+    print('saved %s' % file_location)
+
+
+if __name__ == '__main__':
+    main()
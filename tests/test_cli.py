@@ -0,0 +1,39 @@
+import subprocess
+import sys
+from os.path import dirname
+
+import pytest
+
+import cli
+
+
+def test_usage_lists_every_command(capsys):
+    assert cli.main([]) == 0
+    out = capsys.readouterr().out
+    for name in cli.COMMANDS:
+        assert name in out
+
+
+def test_unknown_command_fails(capsys):
+    assert cli.main(['play']) == 2
+    assert "unknown command 'play'" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('command', sorted(cli.COMMANDS))
+def test_command_help(command, capsys):
+    with pytest.raises(SystemExit) as exit:
+        cli.main([command, '--help'])
+    assert exit.value.code == 0
+    assert 'usage' in capsys.readouterr().out
+
+
+def test_commands_do_not_import_tkinter():
+    # a fresh interpreter, the tests may already have imported it
+    code = ('import sys, cli, importlib\n'
+            'for module, _ in cli.COMMANDS.values():\n'
+            '    importlib.import_module(module)\n'
+            'print("tkinter" in sys.modules)\n')
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         cwd=dirname(dirname(__file__)),
+                         capture_output=True, text=True).stdout
+    assert out.strip() == 'False'
@@ -0,0 +1,50 @@
+from random import seed
+
+import pytest
+
+import game_log
+import q_learning
+from q_table import q_key
+from state import State
+
+SETTINGS = {'Q_GAMES': 5, 'LEARNING_RATE': .5, 'DISCOUNT': .5,
+            'EXPLORE_PROB': .4}
+
+
+def test_log_round_trip(tmp_path):
+    path = str(tmp_path / 'games.jsonl.gz')
+    state = State(board_size=6)
+    moves, q_values = [], []
+    for _ in range(6):
+        move_info = state.legal_moves()[0]
+        moves.append(move_info)
+        q_values.append(len(moves))
+        state = state.move(move_info)
+    with game_log.GameWriter(path) as writer:
+        writer.write(State(board_size=6), moves, q_values, 0)
+    replayed = list(game_log.replay(game_log.read_games(path)))
+    assert [m.steps for _, m, _, _ in replayed] == [m.steps for m in moves]
+    assert replayed[-1][2].board == state.board
+    assert [q for _, _, _, q in replayed] == q_values
+
+
+def test_replay_uses_current_values():
+    state = State(board_size=6)
+    move_info = state.legal_moves()[0]
+    new_state = state.move(move_info)
+    Q = {q_key({}, state)[0]: (0.0, 1), q_key({}, new_state)[0]: (5.0, 1)}
+    expected = dict(Q)
+    seed(1)
+    q_learning._update(expected, SETTINGS, state, new_state, move_info, 5.0)
+    seed(1)
+    # the logged value is stale, the table's value is used instead
+    q_learning.replay_training(Q, SETTINGS,
+                               [(state, move_info, new_state, 99.0)])
+    assert Q == expected
+
+
+def test_workers_cannot_share_gzip_log(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError):
+        q_learning.q_learning(dict(SETTINGS, WORKERS=2,
+                                   GAME_LOG=str(tmp_path / 'log.gz')))
@@ -0,0 +1,34 @@
+from random import Random
+
+import player
+from approx_q import FEATURES, LinearQ
+from inference import InferenceEngine
+from state import State
+
+
+def positions(n, seed=0):
+    rng = Random(seed)
+    states = []
+    for board_size in (6, 8):
+        state = State(board_size=board_size)
+        for _ in range(n):
+            states.append(state)
+            state = state.move(rng.choice(state.legal_moves()))
+            if state.is_game_over():
+                break
+    return states
+
+
+def test_weights_are_served_like_player_move(tmp_path):
+    rng = Random(1)
+    path = str(tmp_path / 'weights.json')
+    LinearQ([rng.uniform(-1, 1) for _ in FEATURES]).save(path)
+    engine = InferenceEngine(path)
+    states = positions(10)
+    requests = [(i % 2 == 0, state) for i, state in enumerate(states)]
+    for (maximize, state), ((new_state, move_info), value) in zip(
+            requests, engine.move_batch(requests)):
+        (expected, expected_info), expected_value = player.move(
+            maximize, state, engine.Q_VALUES)
+        assert move_info.steps == expected_info.steps
+        assert value == expected_value
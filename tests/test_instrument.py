@@ -0,0 +1,24 @@
+import instrument
+from q_learning import q_learning
+from q_table import BoundedQ
+from state import State
+
+SETTINGS = {'Q_GAMES': 12, 'LEARNING_RATE': .8, 'DISCOUNT': .5,
+            'EXPLORE_PROB': .4, 'SEED': 1}
+
+
+def test_parallel_bounded_training_is_counted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = dict(SETTINGS, WORKERS=2, MERGE_GAMES=3, Q_MEMORY=10 ** 6)
+    instrument.enable(interval=None)
+    try:
+        Q = q_learning(settings, State(board_size=6))
+        stats = instrument.snapshot()
+    finally:
+        instrument.disable()
+    # the table is not wrapped, so the workers' copies stay bounded
+    assert isinstance(Q, BoundedQ)
+    assert stats['episodes']['games'] == 12
+    assert stats['episodes']['mean_length'] > 0
+    assert stats['q_table']['size'] == len(Q)
+    assert 'State.make_move' in stats['calls']
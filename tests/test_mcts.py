@@ -0,0 +1,21 @@
+import mcts
+import search
+from approx_q import LinearQ
+from state import Player, State
+
+
+def test_players_value_leaves_with_a_linear_model():
+    model = LinearQ([0, 50, 80, 0, 0, 0, 0])
+    state = State(board_size=6)
+    for player in (mcts.MCTSPlayer(model, time_limit=None, simulations=50),
+                   search.AlphaBetaPlayer(model, time_limit=None,
+                                          node_limit=200)):
+        (new_state, move_info), value = player.move(True, state)
+        assert move_info.steps in [m.steps for m in state.legal_moves()]
+        assert -100 <= value <= 100
+
+
+def test_evaluate_matches_the_model():
+    model = LinearQ([0, 50, 80, 0, 0, 0, 10])
+    state = State(board_size=6, whose_move=Player.RED)
+    assert mcts.evaluate(state, model) == model.value(state) / 100
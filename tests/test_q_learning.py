@@ -0,0 +1,117 @@
+import pickle
+from os import makedirs
+from os.path import isfile
+
+import pytest
+
+import q_learning
+from q_table import BoundedQ, is_table_file, q_key
+from state import State
+
+SETTINGS = {'Q_GAMES': 10, 'LEARNING_RATE': .8, 'DISCOUNT': .5,
+            'EXPLORE_PROB': .4}
+
+
+def board_string(state):
+    return ''.join(str(int(piece)) for row in state.board
+                   for piece in row) + str(int(state.whose_move))
+
+
+def test_legacy_cache_is_converted_in_place(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state = State(board_size=6)
+    new_state = state.move(state.legal_moves()[0])
+    legacy = {board_string(state): (1.5, 3), board_string(new_state): (-2, 1)}
+    path = q_learning.legacy_cache_path(SETTINGS, 6)
+    makedirs('cache')
+    with open(path, 'wb') as file:
+        pickle.dump(legacy, file)
+
+    Q = q_learning.q_learning(SETTINGS, State(board_size=6))
+    assert Q[q_key(Q, state)[0]] == (1.5, 3)
+    assert Q[q_key(Q, new_state)[0]] == (-2, 1)
+    Q.close()
+    assert is_table_file(path)
+    # the current version does not resume from it
+    prefix = q_learning.cache_prefix(SETTINGS, 6)
+    assert q_learning.cached_tables(prefix) == {}
+
+
+def test_no_legacy_name_for_new_options():
+    assert q_learning.legacy_cache_path(SETTINGS, 8) == \
+        'cache/0.8-0.4-0.5-10-8.save'
+    assert q_learning.legacy_cache_path(dict(SETTINGS, SYMMETRY=True), 8) == \
+        'cache/0.8-0.4-0.5-10-8-sym.save'
+    assert q_learning.legacy_cache_path(dict(SETTINGS, Q_MEMORY=10 ** 6),
+                                        8) is None
+
+
+def test_worker_copy_of_bounded_table_stays_bounded():
+    Q = BoundedQ(capacity=64)
+    for key in range(64):
+        Q[key] = (0.0, 1)
+    worker = q_learning._TrackingBoundedQ(Q)
+    worker.merge({key: (1.0, 2) for key in range(64, 128)})
+    assert not worker.touched
+    for key in range(128, 1000):
+        worker[key] = (0.0, 1)
+    assert len(worker) <= 64
+    assert len(worker.touched) == 1000 - 128
+
+
+def test_batch_size_only_keys_approximate_training():
+    assert q_learning.cache_prefix(dict(SETTINGS, BATCH_SIZE=64), 8) == \
+        q_learning.cache_prefix(SETTINGS, 8)
+    approximate = dict(SETTINGS, APPROXIMATE=True)
+    assert q_learning.cache_prefix(dict(approximate, BATCH_SIZE=64), 8) != \
+        q_learning.cache_prefix(approximate, 8)
+    assert q_learning.legacy_cache_path(dict(SETTINGS, BATCH_SIZE=64), 8) \
+        is not None
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_interrupted_training_resumes_from_its_checkpoint(tmp_path,
+                                                           monkeypatch):
+    settings = dict(SETTINGS, Q_GAMES=30, CHECKPOINT_GAMES=10, SEED=3)
+    (tmp_path / 'whole').mkdir()
+    (tmp_path / 'resumed').mkdir()
+
+    monkeypatch.chdir(tmp_path / 'whole')
+    whole = q_learning.q_learning(settings, State(board_size=6))
+
+    monkeypatch.chdir(tmp_path / 'resumed')
+    games = []
+
+    def interrupt(Q, moves):
+        games.append(moves)
+        if len(games) == 25:
+            raise Interrupted()
+
+    monkeypatch.setattr(q_learning, '_episode_hook', interrupt)
+    with pytest.raises(Interrupted):
+        q_learning.q_learning(settings, State(board_size=6))
+    prefix = q_learning.cache_prefix(settings, 6)
+    assert isfile(prefix + '.checkpoint')
+    assert q_learning._load_checkpoint(prefix + '.checkpoint')[0]['games'] \
+        == 20
+    monkeypatch.setattr(q_learning, '_episode_hook', None)
+    resumed = q_learning.q_learning(settings, State(board_size=6))
+    assert resumed == whole
+    assert not isfile(prefix + '.checkpoint')
+
+
+def test_missing_tablebase_fails_before_training(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = dict(SETTINGS, TABLEBASE='typo.tb', WORKERS=2)
+    with pytest.raises(FileNotFoundError):
+        q_learning.q_learning(settings, State(board_size=6))
+
+
+def test_approximate_training_rejects_table_only_settings():
+    settings = dict(SETTINGS, APPROXIMATE=True, OPENING_BOOK=True,
+                    GAME_LOG='games.log')
+    with pytest.raises(ValueError, match='GAME_LOG, OPENING_BOOK'):
+        q_learning.q_learning(settings, State(board_size=6))
@@ -0,0 +1,104 @@
+import pickle
+import tracemalloc
+from random import Random
+
+import pytest
+
+from q_learning import load_q, merge_q, save_q
+from q_table import BoundedQ, CanonicalQ, MappedQ, is_table_file
+
+
+@pytest.mark.parametrize('kind', [dict, CanonicalQ])
+def test_saved_table_loads_unchanged(tmp_path, kind):
+    rng = Random(0)
+    Q = kind()
+    for _ in range(1000):
+        # q values as stored, rounded to 32 bit floats
+        Q[rng.getrandbits(64)] = (float(rng.randint(-400, 400)) / 4,
+                                  rng.randint(1, 10 ** 6))
+    path = str(tmp_path / 'table.save')
+    save_q(Q, path)
+    loaded = load_q(path)
+    assert isinstance(loaded, MappedQ)
+    assert loaded.canonical == (kind is CanonicalQ)
+    assert len(loaded) == len(Q)
+    assert dict(loaded.items()) == Q
+    assert loaded.to_dict() == Q
+    assert type(loaded.to_dict()) is kind
+    assert 12345 not in loaded
+    assert loaded.get(12345) is None
+    # other processes get the mapped file, not a copy of the table
+    copy = pickle.loads(pickle.dumps(loaded))
+    assert copy.file_location == path and dict(copy.items()) == Q
+    copy.close()
+    loaded.close()
+
+
+def test_pickled_tables_are_converted(tmp_path):
+    path = str(tmp_path / 'table.save')
+    with open(path, 'wb') as file:
+        pickle.dump({1: (0.5, 2), 2: (-1.0, 1)}, file)
+    Q = load_q(path)
+    assert dict(Q.items()) == {1: (0.5, 2), 2: (-1.0, 1)}
+    Q.close()
+    # written back in the compact format
+    assert is_table_file(path)
+
+
+def test_merge_weights_workers_by_added_visits():
+    Q = {1: (0.0, 10), 2: (5.0, 1)}
+    deltas = [
+        {1: (2.0, 11), 2: (5.0, 1), 3: (1.0, 1)},
+        {1: (8.0, 13), 3: (3.0, 1)},
+    ]
+    updates = merge_q(Q, deltas)
+    # one and three visits were added on top of the ten already in Q
+    assert updates[1] == ((2.0 * 1 + 8.0 * 3) / 4, 14)
+    # new to Q, every visit a worker counted is added
+    assert updates[3] == (2.0, 2)
+    # written without a new visit, e.g. a freshly seen successor
+    assert updates[2] == (5.0, 1)
+
+
+def test_bounded_table_evicts_least_visited_old_entries():
+    Q = BoundedQ(capacity=128)
+    assert Q.batch == 2
+    for key in range(128):
+        # the oldest entries are visited more, except keys 5 and 7
+        Q[key] = (0.0, 1 if key in (5, 7) else 100)
+    Q[0]
+    Q[1000] = (0.0, 1)
+    assert len(Q) == 127
+    assert 5 not in Q and 7 not in Q and 0 in Q and 1000 in Q
+    stats = Q.stats()
+    assert stats['evictions'] == 2 and stats['hits'] == 1
+    with pytest.raises(KeyError):
+        Q[5]
+    assert Q.stats()['misses'] == 1
+
+
+def test_bounded_table_stays_within_its_budget():
+    Q = BoundedQ(max_bytes=100 * BoundedQ.ENTRY_BYTES)
+    for key in range(10000):
+        Q[key] = (0.0, key % 7 + 1)
+    assert len(Q) <= Q.capacity == 100
+    # copies from items neither count lookups nor reorder
+    order = list(Q)
+    assert list(dict(Q.items())) == order
+    assert Q.stats()['hits'] == 0 and list(Q) == order
+
+
+def test_bounded_table_footprint_under_eviction():
+    max_bytes = 5000 * BoundedQ.ENTRY_BYTES
+    rng = Random(0)
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        Q = BoundedQ(max_bytes=max_bytes)
+        for _ in range(5 * Q.capacity):
+            Q[rng.getrandbits(64)] = (rng.random(), rng.randint(1, 50))
+        used = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    assert Q.evictions > 0
+    assert used <= max_bytes
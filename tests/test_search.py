@@ -0,0 +1,64 @@
+import search
+from state import Piece, Player, State
+
+
+class EveryPositionWon(dict):
+    """Values every position close to a win for red."""
+    def get(self, key, default=None):
+        return (99.0, 1)
+
+
+def test_high_q_values_do_not_stop_the_search():
+    player = search.AlphaBetaPlayer(EveryPositionWon(), time_limit=None,
+                                    node_limit=3000)
+    player.move(True, State(board_size=6))
+    assert player.depth > 1
+
+
+def test_wins_are_reported_on_the_q_value_scale():
+    board = [[Piece.EMPTY] * 6 for _ in range(6)]
+    board[3][2] = Piece.RED_KING
+    board[2][1] = Piece.BLACK_PAWN
+    state = State(board=board, whose_move=Player.RED, board_size=6)
+    player = search.AlphaBetaPlayer(time_limit=None, node_limit=1000)
+    (new_state, _), value = player.move(True, state)
+    assert new_state.is_game_over() == Player.RED
+    assert value == search.WIN_VALUE - 1
+    assert player.depth == 1
+
+
+def test_move_keeps_the_table_between_calls():
+    Q = {}
+    state = State(board_size=6)
+    (state, _), _ = search.move(False, state, Q, time_limit=None,
+                                node_limit=500)
+    player = search._players[id(Q)][1]
+    search.move(True, state, Q, time_limit=None, node_limit=500)
+    assert search._players[id(Q)][1] is player
+    assert player.age == 2 and player.table
+
+
+def test_full_table_keeps_the_last_move():
+    player = search.AlphaBetaPlayer(time_limit=None, node_limit=500,
+                                    table_size=100)
+    state = State(board_size=6)
+    for _ in range(4):
+        (state, _), _ = player.move(state.whose_move == Player.RED, state)
+    assert all(entry[4] >= player.age - 1 for entry in player.table.values())
+
+
+def test_table_wins_count_from_the_current_position():
+    board = [[Piece.EMPTY] * 6 for _ in range(6)]
+    board[4][1] = Piece.RED_KING
+    board[4][3] = Piece.RED_KING
+    board[0][3] = Piece.BLACK_PAWN
+    state = State(board=board, whose_move=Player.RED, board_size=6)
+    player = search.AlphaBetaPlayer(time_limit=None, max_depth=8)
+    (state, _), value = player.move(True, state)
+    assert value == search.WIN_VALUE - 5
+    # two moves later the win is two moves closer, table or not
+    for new_state, _ in state.generate_successors():
+        (_, _), value = player.move(True, new_state)
+        fresh = search.AlphaBetaPlayer(time_limit=None, max_depth=8)
+        assert value == fresh.move(True, new_state)[1] == \
+            search.WIN_VALUE - 3
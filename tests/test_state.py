@@ -0,0 +1,143 @@
+from random import Random
+
+import pytest
+
+from benchmark import bitboard_perft, perft
+from bitboard import BitboardState
+from state import (DRAW_MOVES, GameHistory, Location, Piece, Player, State,
+                   flipped_zobrist_hash, zobrist_hash)
+
+
+def random_games(board_size, games=10, rng_seed=0):
+    """Yields every position of seeded random games."""
+    rng = Random(rng_seed)
+    for _ in range(games):
+        state = State(board_size=board_size)
+        while not state.is_game_over():
+            yield state
+            state = state.move(rng.choice(state.legal_moves()))
+        yield state
+
+
+def empty_board(size=8):
+    return [[Piece.EMPTY] * size for _ in range(size)]
+
+
+# node counts of the move generator before the engine was rewritten
+@pytest.mark.parametrize('board_size, depth, nodes', [
+    (6, 8, 36918), (8, 6, 36768), (10, 4, 4265)])
+def test_perft_matches_the_original_engine(board_size, depth, nodes):
+    state = State(board_size=board_size)
+    assert perft(state, depth) == nodes
+    assert bitboard_perft(BitboardState.from_state(state), depth) == nodes
+
+
+def test_jump_chain_may_end_on_its_origin():
+    board = empty_board()
+    board[3][2] = Piece.RED_KING
+    for x, y in ((3, 4), (5, 4), (5, 2), (3, 2)):
+        board[y][x] = Piece.BLACK_PAWN
+    state = State(board=board, whose_move=Player.RED)
+    # the loop can be jumped either way round
+    for move_info in state.legal_moves():
+        assert move_info.steps[0] == move_info.steps[-1] == Location(2, 3)
+        assert len(move_info.kills) == 4
+        new_state = state.move(move_info)
+        assert new_state.get_piece(2, 3) == Piece.RED_KING
+        assert new_state.is_game_over() == Player.RED
+
+
+@pytest.mark.parametrize('board_size', [6, 8, 10])
+def test_bitboard_moves_match_state_moves(board_size):
+    for state in random_games(board_size, games=5):
+        bitboard = BitboardState.from_state(state)
+        moves = sorted((tuple(m.steps), tuple(m.kills))
+                       for m in state.legal_moves())
+        assert sorted((tuple(m.steps), tuple(m.kills))
+                      for m in bitboard.generate_moves()) == moves
+        for new_bitboard, move_info in bitboard.generate_successors():
+            assert new_bitboard == \
+                BitboardState.from_state(state.move(move_info))
+        assert bitboard.is_game_over() == state.is_game_over()
+
+
+@pytest.mark.parametrize('board_size', [6, 8])
+def test_incremental_hash_matches_a_full_rehash(board_size):
+    for state in random_games(board_size):
+        assert state.zobrist == zobrist_hash(state.board, state.whose_move,
+                                             board_size)
+        assert state.flipped_zobrist == flipped_zobrist_hash(
+            state.board, state.whose_move, board_size)
+        for move_info in state.legal_moves():
+            board = [row[:] for row in state.board]
+            hashes = state.zobrist, state.flipped_zobrist
+            undo = state.make_move(move_info)
+            assert state.zobrist == zobrist_hash(
+                state.board, state.whose_move, board_size)
+            state.unmake_move(undo)
+            assert state.board == board
+            assert (state.zobrist, state.flipped_zobrist) == hashes
+
+
+def shuffle_kings():
+    """Two kings that can move back and forth forever."""
+    board = empty_board()
+    board[0][1] = Piece.BLACK_KING
+    board[7][6] = Piece.RED_KING
+    return State(board=board, whose_move=Player.BLACK)
+
+
+def play(history, state, steps):
+    for (x, y), (nx, ny) in steps:
+        move_info = next(m for m in state.legal_moves()
+                         if m.steps == [Location(x, y), Location(nx, ny)])
+        new_state = state.move(move_info)
+        drawn = history.push(state, move_info, new_state)
+        state = new_state
+    return state, drawn
+
+
+def test_third_repetition_is_a_draw():
+    state = shuffle_kings()
+    history = GameHistory(state)
+    cycle = [((1, 0), (2, 1)), ((6, 7), (5, 6)),
+             ((2, 1), (1, 0)), ((5, 6), (6, 7))]
+    state, drawn = play(history, state, cycle)
+    assert not drawn
+    state, drawn = play(history, state, cycle[:3])
+    assert not drawn
+    # the start position comes up for the third time
+    state, drawn = play(history, state, cycle[3:])
+    assert drawn
+
+
+def test_pawn_moves_reset_the_draw_rules():
+    board = empty_board()
+    board[0][1] = Piece.BLACK_KING
+    board[5][0] = Piece.BLACK_PAWN
+    board[7][6] = Piece.RED_KING
+    state = State(board=board, whose_move=Player.BLACK)
+    history = GameHistory(state)
+    state, drawn = play(history, state, [((1, 0), (2, 1)), ((6, 7), (5, 6))])
+    assert history.quiet_moves == 2
+    state, drawn = play(history, state, [((0, 5), (1, 6))])
+    assert history.quiet_moves == 0 and len(history.counts) == 1
+
+
+def test_no_progress_draw():
+    state = shuffle_kings()
+    history = GameHistory(state)
+    rng = Random(0)
+    for moves in range(1, DRAW_MOVES + 1):
+        move_info = rng.choice(state.legal_moves())
+        new_state = state.move(move_info)
+        drawn = history.push(state, move_info, new_state)
+        state = new_state
+        if drawn:
+            break
+    # two lone kings repeat positions long before the move limit
+    assert drawn
+    history = GameHistory()
+    history.quiet_moves = DRAW_MOVES - 1
+    move_info = state.legal_moves()[0]
+    assert history.push(state, move_info, state.move(move_info))
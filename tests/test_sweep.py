@@ -0,0 +1,36 @@
+from random import Random
+
+import sweep
+
+
+def test_parallel_sweep_can_train_with_workers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    configs = [{'LEARNING_RATE': .5}, {'LEARNING_RATE': .8}]
+    base = {'Q_GAMES': 20, 'WORKERS': 2, 'SEED': 1}
+    results = sweep.run_sweep(configs, base, board_size=6, eval_games=4,
+                              workers=2)
+    assert sorted(r['index'] for r in results) == [0, 1]
+    assert not any(r['cached'] for r in results)
+    again = sweep.run_sweep(configs, base, board_size=6, eval_games=4,
+                            workers=2)
+    assert all(r['cached'] for r in again)
+
+
+def test_approximate_models_are_reported_cached(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    configs = [{'LEARNING_RATE': .5}]
+    base = {'Q_GAMES': 5, 'APPROXIMATE': True, 'SEED': 1}
+    sweep.run_sweep(configs, base, board_size=6, eval_games=2, workers=1)
+    result, = sweep.run_sweep(configs, base, board_size=6, eval_games=2,
+                              workers=1)
+    assert result['cached']
+
+
+def test_random_search_keeps_integer_settings_whole():
+    parameters = {'Q_GAMES': (100.0, 5000.0), 'BATCH_SIZE': (8.0, 64.0),
+                  'LEARNING_RATE': (.1, .9)}
+    for config in sweep.random_search(parameters, 20, Random(0)):
+        assert type(config['Q_GAMES']) is int
+        assert 100 <= config['Q_GAMES'] <= 5000
+        assert type(config['BATCH_SIZE']) is int
+        assert type(config['LEARNING_RATE']) is float
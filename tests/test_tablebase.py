@@ -0,0 +1,77 @@
+from itertools import combinations, product
+from random import Random
+
+import pytest
+
+import player
+import tablebase
+from geometry import geometry
+from state import Piece, Player, State
+
+BOARD_SIZE = 6
+PIECES = 2
+
+
+@pytest.fixture(scope='module')
+def table(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('tb') / 'tablebase.tb')
+    tablebase.save_tablebase(tablebase.build_tablebase(BOARD_SIZE, PIECES),
+                             BOARD_SIZE, PIECES, path)
+    table = tablebase.Tablebase(path)
+    yield table
+    table.close()
+
+
+def positions():
+    """Every unfinished two piece position with one piece a side."""
+    locations = geometry(BOARD_SIZE).locations
+    for (a, b), whose_move in product(combinations(locations, 2),
+                                      (Player.RED, Player.BLACK)):
+        for black, red in product((Piece.BLACK_PAWN, Piece.BLACK_KING),
+                                  (Piece.RED_PAWN, Piece.RED_KING)):
+            for (bx, by), (rx, ry) in ((a, b), (b, a)):
+                board = [[Piece.EMPTY] * BOARD_SIZE
+                         for _ in range(BOARD_SIZE)]
+                board[by][bx] = black
+                board[ry][rx] = red
+                state = State(board=board, whose_move=whose_move,
+                              board_size=BOARD_SIZE)
+                if not state.is_game_over():
+                    yield state
+
+
+def test_results_agree_with_successors(table):
+    for state in positions():
+        result, distance = table.probe(state)
+        children = [table.probe(s) for s, _ in state.generate_successors()]
+        if result == tablebase.WIN:
+            assert (tablebase.LOSS, distance - 1) in children
+        elif result == tablebase.LOSS:
+            assert all(r == tablebase.WIN for r, _ in children)
+            assert max(d for _, d in children) == distance - 1
+        else:
+            assert any(r == tablebase.DRAW for r, _ in children)
+            assert tablebase.LOSS not in (r for r, _ in children)
+
+
+@pytest.mark.parametrize('whose_move', [Player.RED, Player.BLACK])
+@pytest.mark.parametrize('maximize', [True, False])
+def test_player_converts_wins_for_either_colour(table, whose_move, maximize):
+    won = [s for s in positions() if s.whose_move == whose_move and
+           table.probe(s)[0] == tablebase.WIN and table.probe(s)[1] > 1]
+    assert won
+    for state in Random(1).sample(won, min(len(won), 40)):
+        _, distance = table.probe(state)
+        for _ in range(distance):
+            # the caller's maximize flag must not matter in the tablebase
+            (state, _), _ = player.move(maximize, state, {},
+                                        tablebase=table)
+        assert state.is_game_over() == whose_move
+
+
+def test_missing_tablebase_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(tablebase, 'TABLEBASE_DIR', str(tmp_path))
+    assert tablebase.tablebase(BOARD_SIZE, PIECES) is None
+    with pytest.raises(FileNotFoundError):
+        tablebase.tablebase(BOARD_SIZE, PIECES,
+                            file_location=str(tmp_path / 'typo.tb'))
@@ -0,0 +1,20 @@
+import pytest
+
+from q_learning import save_q
+from tournament import run_match
+
+
+def test_missing_table_fails_before_the_workers_start(tmp_path):
+    path = str(tmp_path / 'a.save')
+    save_q({1: (0.5, 1)}, path)
+    with pytest.raises(FileNotFoundError):
+        run_match(path, str(tmp_path / 'typo.save'), games=2, workers=2)
+
+
+def test_match_between_saved_tables(tmp_path):
+    path = str(tmp_path / 'a.save')
+    save_q({1: (0.5, 1)}, path)
+    summary = run_match(path, path, games=4, board_size=6, max_moves=20,
+                        workers=2, match_seed=1)
+    assert summary['games'] == 4
+    assert summary['wins'] + summary['draws'] + summary['losses'] == 4
@@ -0,0 +1,152 @@
+'''
+tournament.py
+
+A headless match engine that plays two q learning tables against each other
+over a process pool and reports win, draw and loss rates with confidence
+intervals. Games are capped by a number of moves instead of wall clock time.
+
+    python tournament.py cache/a.save cache/b.save --games 2000 --workers 8
+'''
+
+import argparse
+import json
+from math import sqrt
+from multiprocessing import Pool
+from random import seed
+
+import player
+from q_learning import load_q
+from state import GameHistory, Player, State
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# tables of the two agents, set in each worker by _init_worker
+_tables = None
+
+
+def wilson_interval(successes, n, z=1.96):
+    """Returns the Wilson score interval of a proportion."""
+    if n == 0:
+        return (0.0, 1.0)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
+
+def play_game(Q_black, Q_red, board_size=8, max_moves=200):
+    """Plays one game and returns the winning Player, or 0 for a draw.
+
+    Red maximizes the q values and black minimizes them, as in training.
+    Games are drawn by the rules of GameHistory or after max_moves moves.
+    """
+    state = State(board_size=board_size)
+    history = GameHistory(state)
+    for _ in range(max_moves):
+        winner = state.is_game_over()
+        if winner:
+            return winner
+        if state.whose_move == Player.RED:
+            (new_state, move_info), _ = player.move(True, state, Q_red)
+        else:
+            (new_state, move_info), _ = player.move(False, state, Q_black)
+        drawn = history.push(state, move_info, new_state)
+        state = new_state
+        if drawn:
+            break
+    return state.is_game_over()
+
+
+def _init_worker(tables):
+    global _tables
+    _tables = tables
+
+
+def _play(task):
+    """Plays game i of a match, the first agent is black in even games."""
+    i, board_size, max_moves, match_seed = task
+    if match_seed is not None:
+        seed(match_seed * 1000003 + i)
+    first, second = _tables
+    if i % 2 == 0:
+        winner = play_game(first, second, board_size, max_moves)
+        first_color = Player.BLACK
+    else:
+        winner = play_game(second, first, board_size, max_moves)
+        first_color = Player.RED
+    if not winner:
+        return DRAW
+    return WIN if winner == first_color else LOSS
+
+
+def run_match(table_a, table_b, games=1000, board_size=8, max_moves=200,
+              workers=None, match_seed=None):
+    """Plays games between two tables and returns the results of the first.
+
+    The tables may be q tables or paths to saved tables. Paths are loaded
+    here, so a missing file fails before any worker starts, and the workers
+    map the same files. Colors alternate between games.
+    """
+    tasks = [(i, board_size, max_moves, match_seed) for i in range(games)]
+    tables = tuple(load_q(t) if isinstance(t, str) else t
+                   for t in (table_a, table_b))
+    try:
+        if workers == 1:
+            _init_worker(tables)
+            results = [_play(task) for task in tasks]
+        else:
+            with Pool(workers, _init_worker, (tables,)) as pool:
+                results = pool.map(
+                    _play, tasks,
+                    chunksize=max(1, games // (8 * (workers or 8))))
+    finally:
+        for t, table in zip((table_a, table_b), tables):
+            if isinstance(t, str) and hasattr(table, 'close'):
+                table.close()
+    return summarize(results)
+
+
+def summarize(results):
+    """Counts WIN, DRAW and LOSS results into rates and intervals."""
+    n = len(results)
+    summary = {'games': n}
+    for name, outcome in (('win', WIN), ('draw', DRAW), ('loss', LOSS)):
+        count = results.count(outcome)
+        summary[name + 's' if name != 'loss' else 'losses'] = count
+        summary[name + '_rate'] = count / n if n else 0.0
+        summary[name + '_95ci'] = wilson_interval(count, n)
+    # score counts a draw as half a win
+    points = [(r + 1) / 2 for r in results]
+    score = sum(points) / n if n else 0.0
+    margin = 0.0
+    if n > 1:
+        variance = sum((p - score) ** 2 for p in points) / (n - 1)
+        margin = 1.96 * sqrt(variance / n)
+    summary['score'] = score
+    summary['score_95ci'] = (max(0.0, score - margin),
+                             min(1.0, score + margin))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plays two q tables '
+                                     'against each other without a gui.')
+    parser.add_argument('table_a')
+    parser.add_argument('table_b')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--max-moves', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    summary = run_match(args.table_a, args.table_b, args.games,
+                        args.board_size, args.max_moves, args.workers,
+                        args.seed)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()